@@ -0,0 +1,208 @@
+"""
+Compare the runtime and peak memory of the frequency-based methods, the
+nearby tower search and the segment-based find_migrants on the same
+synthetic hourly CDR data, at several numbers of users.
+
+    python benchmarks/frequency_methods.py --users 200,1000,5000 --days 540
+
+Each method runs in a fresh Python process on data generated beforehand,
+so the peak memory of one method is not hidden by the others.
+"""
+from __future__ import division, print_function
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+
+FREQUENCY_METHODS = ['method1', 'method2', 'method2_over_prop', 'method3',
+                     'method4', 'method5', 'method6']
+METHODS = FREQUENCY_METHODS + ['find_tower_nearby', 'segment']
+START_DATE = 20170101
+
+
+def generate_towers(num_districts=50, towers_per_district=20, seed=0):
+    """
+    Towers scattered around the centers of districts on a grid 0.2 degree apart,
+    so that the towers of a district are a few hundred meters to 2 km apart.
+    Return a SFrame of 'Dist_ID', 'SITEID', 'LONG', 'LAT'.
+    """
+    import graphlab as gl
+    random = np.random.RandomState(seed)
+    district = np.repeat(np.arange(num_districts), towers_per_district)
+    side = int(np.ceil(np.sqrt(num_districts)))
+    return gl.SFrame({
+        'Dist_ID': district,
+        'SITEID': np.arange(len(district)),
+        'LONG': 30 + 0.2 * (district % side) + random.uniform(-0.01, 0.01, len(district)),
+        'LAT': -2 + 0.2 * (district // side) + random.uniform(-0.01, 0.01, len(district)),
+    })
+
+
+def generate_hourly_cdr(towers, num_users, num_days, migrant_share=0.3, active_prob=0.7,
+                        records_per_day=3, travel_prob=0.05, seed=0):
+    """
+    Hourly records of users at the towers of their current district.
+
+    Each user has a home district; migrants move to another district on a
+    random day at least 120 days from the start and the end. A user is seen
+    on a day with active_prob, records_per_day times on average (at least
+    once), at random hours, and at a random other district with travel_prob.
+    Return a SFrame of 'user_id', 'date', 'hour', 'cell_tower', 'Dist_ID'.
+    """
+    import graphlab as gl
+    from migration_detector.date_utils import date_to_day, day_to_date
+    random = np.random.RandomState(seed)
+    tower_district = np.array(towers['Dist_ID'])
+    num_districts = tower_district.max() + 1
+    towers_per_district = len(tower_district) // num_districts
+
+    home = random.randint(num_districts, size=num_users)
+    destination = (home + random.randint(1, num_districts, size=num_users)) % num_districts
+    migration_day = np.where(random.rand(num_users) < migrant_share,
+                             random.randint(120, max(121, num_days - 120), size=num_users),
+                             num_days)
+
+    user_id, day = np.nonzero(random.rand(num_users, num_days) < active_prob)
+    num_records = random.poisson(records_per_day - 1, size=len(user_id)) + 1
+    user_id = np.repeat(user_id, num_records)
+    day = np.repeat(day, num_records)
+    district = np.where(day < migration_day[user_id], home[user_id], destination[user_id])
+    travel = random.rand(len(district)) < travel_prob
+    district[travel] = random.randint(num_districts, size=travel.sum())
+    cell_tower = district * towers_per_district + random.randint(towers_per_district,
+                                                                 size=len(district))
+    return gl.SFrame({
+        'user_id': user_id,
+        'date': day_to_date(day + date_to_day(START_DATE)),
+        'hour': random.randint(24, size=len(user_id)),
+        'cell_tower': cell_tower,
+        'Dist_ID': tower_district[cell_tower],
+    })
+
+
+def daily_district(hourly):
+    """
+    The district with the most records of each user and day, as the daily
+    input of find_migrants: 'user_id', 'date', 'location'.
+    """
+    import graphlab as gl
+    daily = hourly.groupby(['user_id', 'date', 'Dist_ID'], {'count': gl.aggregate.COUNT()})
+    daily = daily.groupby(['user_id', 'date'],
+                          {'location': gl.aggregate.ARGMAX('count', 'Dist_ID')})
+    return daily.select_columns(['user_id', 'date', 'location'])
+
+
+def prepare_data(data_dir, num_users, num_days, num_districts, seed):
+    """
+    Generate the data of one scale into data_dir: the towers, the hourly
+    records with 'month_idx' and 'nearby_tower', and the daily csv.
+    Return the number of hourly records.
+    """
+    from migration_detector import frequency_based
+    towers = generate_towers(num_districts, seed=seed)
+    hourly = generate_hourly_cdr(towers, num_users, num_days, seed=seed)
+    hourly = frequency_based.add_month_idx(hourly)
+    hourly = frequency_based.add_nearby_tower(hourly, towers)
+    towers.save(os.path.join(data_dir, 'towers'))
+    hourly.save(os.path.join(data_dir, 'hourly'))
+    daily_district(hourly).export_csv(os.path.join(data_dir, 'daily.csv'))
+    return len(hourly)
+
+
+def peak_memory_mb():
+    """
+    Peak resident memory of this process and its finished child processes.
+    """
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # kilobytes on Linux, bytes on macOS
+    return peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+def run_method(method, data_dir):
+    """
+    Run one method on the data of data_dir (in a fresh process).
+    Return the seconds it took and the peak memory before and after it.
+    """
+    import graphlab as gl
+    from migration_detector import frequency_based
+    towers = gl.load_sframe(os.path.join(data_dir, 'towers'))
+    if method in FREQUENCY_METHODS:
+        hourly = gl.load_sframe(os.path.join(data_dir, 'hourly'))
+        hourly.__materialize__()
+    load_mb = peak_memory_mb()
+    start = time.time()
+    if method == 'find_tower_nearby':
+        result = frequency_based.find_tower_nearby(towers)
+    elif method == 'segment':
+        from migration_detector import read_csv
+        traj = read_csv(os.path.join(data_dir, 'daily.csv'))
+        result = traj.find_migrants()
+    else:
+        result = frequency_based.run_methods(hourly, towers, methods=[method])[method]
+    if result is not None:
+        result.__materialize__()
+    return {'seconds': time.time() - start, 'load_mb': load_mb, 'peak_mb': peak_memory_mb(),
+            'migrations': 0 if result is None or method == 'find_tower_nearby' else len(result)}
+
+
+def measure(method, data_dir):
+    """
+    Run method in a fresh Python process and return its measurements.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([REPO_PATH, env.get('PYTHONPATH', '')])
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), '--run', method, '--data-dir', data_dir],
+        env=env)
+    return json.loads(output.decode().strip().split('\n')[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--users', default='200,1000',
+                        help='comma-separated numbers of users to run at')
+    parser.add_argument('--days', type=int, default=540, help='number of days of records')
+    parser.add_argument('--districts', type=int, default=50, help='number of districts')
+    parser.add_argument('--methods', default=','.join(METHODS),
+                        help='comma-separated methods among ' + ', '.join(METHODS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--run', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--data-dir', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_method(args.run, args.data_dir)))
+        return
+    methods = args.methods.split(',')
+    for method in methods:
+        assert method in METHODS, "unknown method " + method
+    print('%-18s %8s %10s %9s %12s %9s %9s %10s' % (
+        'method', 'users', 'records', 'seconds', 'records/s', 'load MB', 'peak MB', 'migrations'))
+    for num_users in [int(users) for users in args.users.split(',')]:
+        data_dir = tempfile.mkdtemp(prefix='frequency_methods_')
+        try:
+            num_records = prepare_data(data_dir, num_users, args.days, args.districts, args.seed)
+            for method in methods:
+                result = measure(method, data_dir)
+                # the tower search does not depend on the records
+                throughput = '-' if method == 'find_tower_nearby' else \
+                    '%.0f' % (num_records / max(result['seconds'], 1e-9))
+                print('%-18s %8d %10d %9.2f %12s %9.0f %9.0f %10d' % (
+                    method, num_users, num_records, result['seconds'], throughput,
+                    result['load_mb'], result['peak_mb'], result['migrations']))
+                sys.stdout.flush()
+        finally:
+            shutil.rmtree(data_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Measure the time to import migration_detector in a fresh Python process,
+and check that the plotting dependencies are not loaded by the import.
+
+    python benchmarks/import_time.py --repeat 20
+"""
+from __future__ import print_function
+import argparse
+import os
+import subprocess
+import sys
+
+DEFERRED_MODULES = ['matplotlib', 'seaborn', 'pandas']
+
+IMPORT_SCRIPT = """
+import sys, time
+start = time.time()
+import {module}
+print(time.time() - start)
+print(' '.join(m for m in {deferred!r} if m in sys.modules))
+"""
+
+
+def time_import(module, repeat):
+    """
+    Import module in repeat fresh processes.
+    Return the import times in seconds and the deferred modules loaded by the import.
+    """
+    script = IMPORT_SCRIPT.format(module=module, deferred=DEFERRED_MODULES)
+    env = dict(os.environ)
+    repo_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([repo_path, env.get('PYTHONPATH', '')])
+    import_time = []
+    loaded = set()
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', script], env=env)
+        lines = output.decode().split('\n')
+        import_time.append(float(lines[0]))
+        loaded.update(lines[1].split())
+    return sorted(import_time), sorted(loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=10, help='number of fresh processes')
+    args = parser.parse_args()
+
+    loaded_by = {}
+    for module in ['graphlab', 'migration_detector']:
+        import_time, loaded_by[module] = time_import(module, args.repeat)
+        print('import %-20s min %.3fs  median %.3fs  max %.3fs' % (
+            module, import_time[0], import_time[len(import_time) // 2], import_time[-1]))
+    # modules already loaded by the computing engine are not counted
+    loaded = sorted(set(loaded_by['migration_detector']) - set(loaded_by['graphlab']))
+    print('deferred modules loaded at import: ' + (', '.join(loaded) or 'none'))
+    if loaded:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,2 +1,4 @@
-from .file_io import read_csv, to_csv
+from .file_io import read_csv, read_hourly, to_csv
+from .external_sort import read_csv_external
 from .core import TrajRecord
+from .flows import FlowMatrix
@@ -0,0 +1,161 @@
+import graphlab as gl
+import hashlib
+import json
+import os
+import shutil
+
+# Stages of find_migrants in order, with the columns of user_traj they add
+# and the parameters they depend on (in addition to those of the stages before).
+STAGES = ['filled_record', 'segment_over_prop', 'medium_segment', 'long_seg', 'migration_result']
+STAGE_COLUMNS = {
+    'filled_record': ['filled_record'],
+    'segment_over_prop': ['segment_dict', 'segment_over_prop', 'segment_over_prop_num'],
+    'medium_segment': ['medium_segment', 'medium_segment_num'],
+    'long_seg': ['long_seg', 'long_seg_num'],
+    'migration_result': ['migration_result'],
+}
+# The stages whose columns each stage is computed from
+STAGE_DEPENDS = {
+    'filled_record': [],
+    'segment_over_prop': ['filled_record'],
+    'medium_segment': ['segment_over_prop'],
+    'long_seg': ['medium_segment'],
+    'migration_result': ['long_seg'],
+}
+STAGE_PARAMS = {
+    'filled_record': ['num_days_missing_gap', 'prefilter'],
+    'segment_over_prop': ['small_seg_len', 'seg_prop'],
+    'medium_segment': [],
+    'long_seg': ['min_overlap_part_len', 'num_stayed_days_migrant'],
+    'migration_result': [],
+}
+METADATA_FILE = 'checkpoint.json'
+# Version of the layout of the saved columns (2: segments as flat lists of ints,
+# 3: 'migration_result' in user_traj)
+FORMAT_VERSION = 3
+
+
+def file_fingerprint(file_paths, **options):
+    """
+    Fingerprint of the input files (path, size and modification time)
+    and the options used to read them.
+    """
+    if not isinstance(file_paths, (list, tuple)):
+        file_paths = [file_paths]
+    files = []
+    for file_path in sorted(file_paths):
+        stat = os.stat(file_path)
+        files.append([os.path.abspath(file_path), stat.st_size, int(stat.st_mtime)])
+    content = json.dumps({'files': files, 'options': options}, sort_keys=True, default=str)
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+
+def stage_params(stage, params):
+    """
+    Parameters that the result of this stage depends on.
+    """
+    names = []
+    for previous_stage in STAGES[:STAGES.index(stage) + 1]:
+        names += STAGE_PARAMS[previous_stage]
+    return dict((name, params[name]) for name in names)
+
+
+class StageCheckpoint():
+    """
+    Persist the completed stages of find_migrants in a local directory,
+    so that a later run with the same input and parameters can resume from
+    the last valid stage.
+
+    Each saved stage of user_traj has all the columns up to that stage,
+    so only the latest snapshot is kept on disk.
+    """
+    def __init__(self, checkpoint_dir, fingerprint, params):
+        """
+        Attributes
+        ----------
+        checkpoint_dir : str
+            Local directory of the checkpoint
+        fingerprint : str
+            Fingerprint of the input data
+        params : dict
+            Parameters of find_migrants
+        """
+        assert fingerprint is not None, "checkpoint needs the fingerprint of the input data"
+        self.checkpoint_dir = checkpoint_dir
+        self.fingerprint = fingerprint
+        self.params = params
+        if not os.path.isdir(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
+        self.metadata = self._read_metadata()
+
+    def _read_metadata(self):
+        metadata_path = os.path.join(self.checkpoint_dir, METADATA_FILE)
+        if os.path.isfile(metadata_path):
+            with open(metadata_path) as f:
+                metadata = json.load(f)
+            if (metadata.get('fingerprint') == self.fingerprint and
+                    metadata.get('format_version') == FORMAT_VERSION):
+                return metadata
+        return {'fingerprint': self.fingerprint, 'format_version': FORMAT_VERSION, 'stages': {}}
+
+    def _write_metadata(self):
+        metadata_path = os.path.join(self.checkpoint_dir, METADATA_FILE)
+        with open(metadata_path + '.tmp', 'w') as f:
+            json.dump(self.metadata, f, sort_keys=True, indent=2)
+        os.rename(metadata_path + '.tmp', metadata_path)
+
+    def _is_valid(self, stage):
+        stage_metadata = self.metadata['stages'].get(stage)
+        return (stage_metadata is not None and
+                stage_metadata['params'] == stage_params(stage, self.params) and
+                os.path.isdir(os.path.join(self.checkpoint_dir, stage_metadata['path'])))
+
+    def resume_stage(self):
+        """
+        The last stage that was completed with the same input and parameters,
+        or None if no stage can be reused.
+        """
+        last_stage = None
+        for stage in STAGES:
+            if not self._is_valid(stage):
+                break
+            last_stage = stage
+        return last_stage
+
+    def save(self, stage, sf):
+        """
+        Save user_traj after a completed stage.
+        Return the saved SFrame loaded from the checkpoint, to continue from.
+        """
+        path = stage
+        tmp_path = os.path.join(self.checkpoint_dir, path + '.tmp')
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        sf.save(tmp_path)
+        if os.path.isdir(os.path.join(self.checkpoint_dir, path)):
+            shutil.rmtree(os.path.join(self.checkpoint_dir, path))
+        os.rename(tmp_path, os.path.join(self.checkpoint_dir, path))
+
+        # the stages after this one are not valid any more
+        for later_stage in STAGES[STAGES.index(stage) + 1:]:
+            self.metadata['stages'].pop(later_stage, None)
+        self.metadata['stages'][stage] = {'params': stage_params(stage, self.params), 'path': path}
+        # the earlier stages are kept in this snapshot of user_traj
+        for earlier_stage in STAGES[:STAGES.index(stage)]:
+            earlier_path = self.metadata['stages'].get(earlier_stage, {}).get('path', path)
+            self.metadata['stages'][earlier_stage] = {
+                'params': stage_params(earlier_stage, self.params), 'path': path}
+            if earlier_path != path and os.path.isdir(os.path.join(self.checkpoint_dir, earlier_path)):
+                self._write_metadata()
+                shutil.rmtree(os.path.join(self.checkpoint_dir, earlier_path))
+        self._write_metadata()
+        return gl.load_sframe(os.path.join(self.checkpoint_dir, path))
+
+    def load(self, stage):
+        """
+        Load user_traj saved for stage, with only its columns up to this stage.
+        """
+        sf = gl.load_sframe(os.path.join(self.checkpoint_dir, self.metadata['stages'][stage]['path']))
+        later_columns = [column for later_stage in STAGES[STAGES.index(stage) + 1:]
+                         for column in STAGE_COLUMNS[later_stage]]
+        return sf.remove_columns([column for column in later_columns if column in sf.column_names()])
@@ -0,0 +1,287 @@
+"""
+Command line interface of migration_detector.
+
+    migration-detector detect input.csv [input2.csv ...] --workers 8 --memory-limit 4GB
+    migration-detector detect hourly.csv --tower-district towers.csv --night
+    migration-detector serve saved_traj --port 8000
+    migration-detector partition input.csv --output-dir shards --num-shards 16
+    migration-detector merge result/shard_* --result-path final
+"""
+from __future__ import division, print_function
+import argparse
+import os
+import re
+import sys
+import time
+from .file_io import read_csv, read_hourly, to_csv, expand_paths, has_records
+from .frequency_based import read_tower_district
+from .external_sort import read_csv_external
+from .flows import FlowMatrix, PERIOD_DIVISOR
+from .runtime import set_runtime
+from .service import serve
+from .shard import partition_csv, read_partition_info, merge_results
+
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+
+class Progress():
+    """
+    Report the progress and estimated time left over the input files,
+    assuming the running time is proportional to the file size.
+    """
+    def __init__(self, file_paths, stream=sys.stderr):
+        self.file_size = dict((path, sum(os.path.getsize(one_path) for one_path in expand_paths(path)))
+                              for path in file_paths)
+        self.total_size = sum(self.file_size.values())
+        self.num_files = len(file_paths)
+        self.done_size = 0
+        self.done_files = 0
+        self.start_time = time.time()
+        self.stream = stream
+
+    def update(self, file_path, message=''):
+        self.done_size += self.file_size[file_path]
+        self.done_files += 1
+        elapsed = time.time() - self.start_time
+        if self.done_size > 0:
+            eta = elapsed / self.done_size * (self.total_size - self.done_size)
+        else:
+            eta = 0
+        print('[%d/%d] %s %s elapsed %s ETA %s' % (
+            self.done_files, self.num_files, file_path, message,
+            format_seconds(elapsed), format_seconds(eta)), file=self.stream)
+
+
+def add_detect_arguments(parser):
+    parser.add_argument('input', nargs='+',
+                        help='csv files of user_id, date, location; a directory or a quoted '
+                             'glob pattern is read as one input')
+    parser.add_argument('--result-path', default='result',
+                        help='directory of the results; with several inputs, '
+                             'the results of each input are saved in a sub-directory named after it')
+    parser.add_argument('--file-name', default='migration_event.csv', help='file name of the migration events')
+    parser.add_argument('--segment-file', default=None,
+                        help='also save the segments to this file name')
+    parser.add_argument('--segment-step', type=int, default=3, choices=[1, 2, 3],
+                        help='which step of segments to save (see TrajRecord.output_segments)')
+    parser.add_argument('--save-traj', default=None,
+                        help='directory to save the trajectories and results in, '
+                             'to be queried with the serve command')
+    parser.add_argument('--checkpoint-dir', default=None,
+                        help='save the completed steps here and resume from them when run again; '
+                             'with several inputs, each input has a sub-directory')
+    parser.add_argument('--flow-file', default=None,
+                        help='also save the origin-destination flows of all the inputs '
+                             'to this file name in --result-path')
+    parser.add_argument('--flow-period', default='month', choices=sorted(PERIOD_DIVISOR))
+    parser.add_argument('--flow-weight', default=None, choices=['uncertainty', 'num_error_day'],
+                        help='weight each migration by 1 / (1 + this column)')
+    parser.add_argument('--flows-only', action='store_true',
+                        help='with --flow-file, only count the flows, without saving '
+                             'the migration events')
+    parser.add_argument('--num-stayed-days-migrant', type=int, default=90)
+    parser.add_argument('--num-days-missing-gap', type=int, default=7)
+    parser.add_argument('--small-seg-len', type=int, default=30)
+    parser.add_argument('--seg-prop', type=float, default=0.6)
+    parser.add_argument('--min-overlap-part-len', type=int, default=0)
+    parser.add_argument('--max-gap-home-des', type=int, default=30)
+    parser.add_argument('--hmin', type=int, default=0,
+                        help='short-term migration: minimum days of the home segment')
+    parser.add_argument('--hmax', type=float, default=float('inf'),
+                        help='short-term migration: maximum days of the home segment')
+    parser.add_argument('--dmin', type=int, default=0,
+                        help='short-term migration: minimum days of the destination segment')
+    parser.add_argument('--dmax', type=float, default=float('inf'),
+                        help='short-term migration: maximum days of the destination segment')
+    parser.add_argument('--prefilter', action='store_true',
+                        help='skip the users who cannot be migrants before the segment steps')
+    parser.add_argument('--lean', action='store_true',
+                        help='drop the intermediate segments after detection '
+                             '(--segment-step 1 or 2 then computes them again)')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='compute the segments in this many processes, with the users '
+                             'balanced by cost across tasks')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: number of cores)')
+    parser.add_argument('--memory-limit', default=None,
+                        help='memory for the engine before spilling to disk, e.g. 4GB')
+    parser.add_argument('--users-file', default=None,
+                        help='only read the users in this file (one user_id per line)')
+    parser.add_argument('--sample', type=float, default=None,
+                        help='only read this fraction of the users, chosen by a hash of user_id')
+    parser.add_argument('--start-date', type=int, default=None,
+                        help='only read the records from this date (YYYYMMDD)')
+    parser.add_argument('--end-date', type=int, default=None,
+                        help='only read the records up to this date (YYYYMMDD)')
+    parser.add_argument('--date-range-file', default=None,
+                        help='partition.json of the partition command (or its directory): '
+                             'pin the day index to the dates of all the shards')
+    parser.add_argument('--locations', default=None,
+                        help='only read the records at these comma-separated locations')
+    parser.add_argument('--external-sort', action='store_true',
+                        help='read inputs larger than the memory with sorted runs on disk '
+                             '(using --memory-limit, default 1GB; only with the date filters above)')
+    parser.add_argument('--tmp-dir', default=None,
+                        help='directory of the temporary files of --external-sort')
+    parser.add_argument('--tower-district', default=None,
+                        help='csv of towers (SITEID, Dist_ID): the inputs are then hourly '
+                             'records of user_id, date, hour and tower, reduced to daily '
+                             'districts while reading (using --memory-limit, default 1GB)')
+    parser.add_argument('--tower-column', default='cell_tower',
+                        help='column of the tower in the hourly records')
+    parser.add_argument('--night', action='store_true',
+                        help='only use the hourly records at night (7pm to 9am)')
+
+
+def find_migrants_args(args):
+    return {'num_stayed_days_migrant': args.num_stayed_days_migrant,
+            'num_days_missing_gap': args.num_days_missing_gap,
+            'small_seg_len': args.small_seg_len,
+            'seg_prop': args.seg_prop,
+            'min_overlap_part_len': args.min_overlap_part_len,
+            'max_gap_home_des': args.max_gap_home_des,
+            'hmin': args.hmin,
+            'hmax': args.hmax,
+            'dmin': args.dmin,
+            'dmax': args.dmax,
+            'prefilter': args.prefilter,
+            'lean': args.lean,
+            'processes': args.processes,
+            'flows_only': args.flows_only}
+
+
+def read_csv_args(args):
+    users = None
+    if args.users_file:
+        with open(args.users_file) as f:
+            users = [line.strip() for line in f if line.strip()]
+    locations = None
+    if args.locations:
+        locations = [location.strip() for location in args.locations.split(',')]
+    start_date = args.start_date
+    end_date = args.end_date
+    if args.date_range_file:
+        partition_info = read_partition_info(args.date_range_file)
+        start_date = start_date or partition_info['start_date']
+        end_date = end_date or partition_info['end_date']
+    return {'users': users,
+            'sample': args.sample,
+            'start_date': start_date,
+            'end_date': end_date,
+            'locations': locations}
+
+
+def detect(args):
+    set_runtime(args.workers, args.memory_limit)
+    progress = Progress(args.input)
+    flows = None
+    if args.flow_file:
+        flows = FlowMatrix(period=args.flow_period, weight=args.flow_weight)
+    for file_path in args.input:
+        result_path = args.result_path
+        checkpoint_dir = args.checkpoint_dir
+        save_traj = args.save_traj
+        if len(args.input) > 1:
+            file_name = os.path.splitext(os.path.basename(file_path.rstrip('/')))[0]
+            file_name = re.sub(r'[*?\[\]]', '_', file_name)
+            result_path = os.path.join(result_path, file_name)
+            if checkpoint_dir:
+                checkpoint_dir = os.path.join(checkpoint_dir, file_name)
+            if save_traj:
+                save_traj = os.path.join(save_traj, file_name)
+        if not has_records(file_path):
+            # e.g. a shard of partition without any user
+            progress.update(file_path, 'no records, skipped')
+            continue
+        if args.tower_district:
+            traj = read_hourly(file_path, read_tower_district(args.tower_district),
+                               night=args.night, tower_column=args.tower_column,
+                               memory_limit=args.memory_limit or '1GB', **read_csv_args(args))
+        elif args.external_sort:
+            read_args = read_csv_args(args)
+            assert all(read_args[name] is None for name in ['users', 'sample', 'locations']), \
+                "--external-sort only reads the dates of --start-date, --end-date and --date-range-file"
+            traj = read_csv_external(file_path, memory_limit=args.memory_limit or '1GB',
+                                     tmp_dir=args.tmp_dir, start_date=read_args['start_date'],
+                                     end_date=read_args['end_date'])
+        else:
+            traj = read_csv(file_path, workers=args.workers, **read_csv_args(args))
+        migrants = traj.find_migrants(checkpoint_dir=checkpoint_dir, flows=flows,
+                                      **find_migrants_args(args))
+        if args.flows_only:
+            message = 'flows counted'
+        elif migrants is not None:
+            to_csv(migrants, result_path=result_path, file_name=args.file_name, traj=traj)
+            message = '%d migration events' % len(migrants)
+        else:
+            message = 'no migration events'
+        if args.segment_file:
+            traj.output_segments(result_path=result_path, segment_file=args.segment_file,
+                                 which_step=args.segment_step)
+        if save_traj:
+            traj.save(save_traj, result=migrants)
+        progress.update(file_path, message)
+    if flows is not None:
+        if not os.path.isdir(args.result_path):
+            os.makedirs(args.result_path)
+        flows.to_csv(os.path.join(args.result_path, args.flow_file))
+
+
+def partition(args):
+    partition_csv(args.input, args.output_dir, args.num_shards,
+                  memory_limit=args.memory_limit)
+
+
+def merge(args):
+    file_names = [args.file_name]
+    if args.segment_file:
+        file_names.append(args.segment_file)
+    merge_results(args.input, args.result_path, file_names, flow_file=args.flow_file)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='migration-detector',
+                                     description='Detect migration events in digital trace data.')
+    subparsers = parser.add_subparsers(dest='command')
+    detect_parser = subparsers.add_parser('detect', help='detect migrants in trajectory files')
+    add_detect_arguments(detect_parser)
+    serve_parser = subparsers.add_parser('serve', help='answer queries about users saved by '
+                                                       'detect --save-traj')
+    serve_parser.add_argument('path', help='directory given to detect --save-traj')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8000)
+    serve_parser.add_argument('--quiet', action='store_true', help='do not log the requests')
+    partition_parser = subparsers.add_parser('partition', help='split the input into shards '
+                                                               'by a hash of user_id')
+    partition_parser.add_argument('input', nargs='+', help='csv files of user_id, date, location')
+    partition_parser.add_argument('--output-dir', default='shards')
+    partition_parser.add_argument('--num-shards', type=int, required=True)
+    partition_parser.add_argument('--memory-limit', default='1GB',
+                                  help='memory for reading the input in chunks, e.g. 4GB')
+    merge_parser = subparsers.add_parser('merge', help='combine the results of detect on shards')
+    merge_parser.add_argument('input', nargs='+', help='result directories of the shards')
+    merge_parser.add_argument('--result-path', default='result')
+    merge_parser.add_argument('--file-name', default='migration_event.csv')
+    merge_parser.add_argument('--segment-file', default=None)
+    merge_parser.add_argument('--flow-file', default=None)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'detect':
+        detect(args)
+    elif args.command == 'serve':
+        serve(args.path, host=args.host, port=args.port, quiet=args.quiet)
+    elif args.command == 'partition':
+        partition(args)
+    elif args.command == 'merge':
+        merge(args)
+
+
+if __name__ == '__main__':
+    main()
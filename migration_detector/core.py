@@ -1,14 +1,73 @@
 from __future__ import division
-import pandas as pd
 import numpy as np
 import graphlab as gl
 import os
 import copy
+import itertools
+import json
 from array import array
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.patches as patches
-from traj_utils import *
+from .traj_utils import (fill_missing_day, find_segment, filter_seg_appear_prop,
+                         join_segment_if_no_gap, change_overlap_segment,
+                         find_migration_by_segment, find_migration_events,
+                         flatten_records, num_locations, segment_dict,
+                         SEGMENT_DTYPE, MIGRATION_EVENT_DTYPE)
+from .checkpoint import (STAGES, STAGE_COLUMNS, STAGE_DEPENDS, StageCheckpoint,
+                         FORMAT_VERSION, stage_params)
+from .encoding import Dictionary
+from .schedule import compute_segments_parallel
+
+SEGMENT_STEP_COLUMN = {1: 'segment_over_prop', 2: 'medium_segment', 3: 'long_seg'}
+SEGMENT_PARAMS = ['num_stayed_days_migrant', 'num_days_missing_gap', 'small_seg_len',
+                  'seg_prop', 'min_overlap_part_len']
+# Parameters of the stages computed before any find_migrants (its defaults)
+DEFAULT_PARAMS = {'num_stayed_days_migrant': 90, 'num_days_missing_gap': 7,
+                  'small_seg_len': 30, 'seg_prop': 0.6, 'min_overlap_part_len': 0,
+                  'prefilter': None}
+METADATA_FILE = 'traj_record.json'
+
+
+def compute_segments(all_record, num_stayed_days_migrant=90, num_days_missing_gap=7,
+                     small_seg_len=30, seg_prop=0.6, min_overlap_part_len=0,
+                     until='long_seg'):
+    """
+    Steps 1-5 of find_migrants for one user, up to the stage until
+    (e.g. 'segment_over_prop' stops after step 3).
+    Return a dict with 'all_record' and the columns of each step,
+    the segments as arrays of SEGMENT_DTYPE.
+    """
+    x = {'all_record': all_record}
+    x['filled_record'] = fill_missing_day(all_record, num_days_missing_gap)
+    if until == 'filled_record':
+        return x
+    x['segment_dict'] = find_segment(x['filled_record'], small_seg_len)
+    x['segment_over_prop'] = filter_seg_appear_prop(x, 'segment_dict', seg_prop)
+    if until == 'segment_over_prop':
+        return x
+    x['medium_segment'] = join_segment_if_no_gap(x['segment_over_prop'])
+    if until == 'medium_segment':
+        return x
+    x['long_seg'] = change_overlap_segment(x, 'medium_segment', min_overlap_part_len,
+                                           num_stayed_days_migrant)
+    return x
+
+
+def expand_records(sf, user_columns, record_column, dtype):
+    """
+    Table of the segments or migrations (dtype) stored as flat lists of ints in
+    record_column of sf: one row per record, with the user_columns of its user
+    and one int column per field of dtype.
+    """
+    num_records = np.asarray(sf[record_column].item_length().to_numpy(),
+                             dtype=np.int64) // len(dtype.names)
+    records = np.fromiter(itertools.chain.from_iterable(sf[record_column]),
+                          dtype=np.int32, count=num_records.sum() * len(dtype.names)).view(dtype)
+    table = gl.SFrame(dict(
+        (column, gl.SArray(np.repeat(sf[column].to_numpy(), num_records).tolist(),
+                           dtype=sf[column].dtype()))
+        for column in user_columns))
+    for field in dtype.names:
+        table[field] = gl.SArray(records[field].astype(np.int64))
+    return table
 
 
 class TrajRecord():
@@ -17,7 +76,8 @@ class TrajRecord():
     #     user_id, migration_date, home, destination, home_start, home_end,
     #     destiantion_start, destination_end,
     #     uncertainty, num_error_day
-    def __init__(self, user_traj, raw_traj, index2date, date_num_long):
+    def __init__(self, user_traj, raw_traj, index2date, date_num_long, fingerprint=None,
+                 user_ids=None, locations=None):
         """
         Attributes
         ----------
@@ -29,20 +89,271 @@ class TrajRecord():
             Convert from date index to real date
         date_num_long : gl.SFrame
             Date and num: 'date', 'date_num'
+        fingerprint : str
+            Fingerprint of the input data, to validate checkpoints
+        user_ids : Dictionary
+            Codes of the user ids in user_traj and raw_traj
+        locations : Dictionary
+            Codes of the locations in user_traj and raw_traj
         """
         self.user_traj = user_traj
         self.raw_traj = raw_traj
         self.index2date = index2date
         self.date_num_long = date_num_long
+        self.fingerprint = fingerprint
+        self.user_ids = user_ids
+        self.locations = locations
+        self.pruned_user_traj = None
+        self.params = None
+        self.segment_params = None
+        # parameters of the stages computed in user_traj (see compute_stage)
+        self.stage_params = {}
+        self.lean = False
+
+    def decode(self, sf):
+        """
+        Replace the codes of users and locations in sf, e.g. the result of
+        find_migrants(decode=False), by the original user ids and locations.
+        A result of find_migrants decoded already (with 'user_code') is returned as it is.
+        """
+        if 'user_code' in sf.column_names():
+            return sf
+        if self.user_ids is not None and 'user_id' in sf.column_names():
+            sf = self.user_ids.decode(sf, 'user_id')
+        if self.locations is not None:
+            for column in ['location', 'home', 'destination']:
+                if column in sf.column_names():
+                    sf = self.locations.decode(sf, column)
+        return sf
+
+    def user_columns(self):
+        """
+        Columns that identify a trajectory: the user and the level of the locations if any.
+        """
+        if 'level' in self.user_traj.column_names():
+            return ['user_id', 'level']
+        return ['user_id']
+
+    def save(self, path, result=None):
+        """
+        Save the trajectories, the segments of the last find_migrants and its
+        result to a local directory, to be loaded again with TrajRecord.load
+        (e.g. by the query service, see service.py) without detecting again.
+        """
+        self.restore_pruned_users()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.user_traj.save(os.path.join(path, 'user_traj'))
+        self.raw_traj.save(os.path.join(path, 'raw_traj'))
+        self.date_num_long.save(os.path.join(path, 'date_num_long'))
+        for name in ['user_ids', 'locations']:
+            if getattr(self, name) is not None:
+                getattr(self, name).table.save(os.path.join(path, name))
+        if result is not None:
+            result.save(os.path.join(path, 'result'))
+        metadata = {'index2date': sorted(self.index2date.items()),
+                    'fingerprint': self.fingerprint,
+                    'format_version': FORMAT_VERSION,
+                    'params': self.params,
+                    'stage_params': self.stage_params,
+                    'lean': self.lean,
+                    'user_ids': self.user_ids is not None,
+                    'locations': self.locations is not None,
+                    'result': result is not None}
+        with open(os.path.join(path, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a TrajRecord saved with save. Return the TrajRecord and the
+        saved result of find_migrants (None if it was not saved).
+        """
+        with open(os.path.join(path, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        assert metadata.get('format_version') == FORMAT_VERSION, \
+            "%s was saved by another version of migration_detector, detect again" % path
+        dictionaries = {}
+        for name in ['user_ids', 'locations']:
+            if metadata[name]:
+                dictionaries[name] = Dictionary(
+                    gl.load_sframe(os.path.join(path, name))['value'], sort=False)
+        traj = cls(gl.load_sframe(os.path.join(path, 'user_traj')),
+                   gl.load_sframe(os.path.join(path, 'raw_traj')),
+                   dict((index, date) for index, date in metadata['index2date']),
+                   gl.load_sframe(os.path.join(path, 'date_num_long')),
+                   fingerprint=metadata['fingerprint'] and str(metadata['fingerprint']),
+                   **dictionaries)
+        if metadata['params'] is not None:
+            traj.set_params(dict((str(name), value) for name, value
+                                 in metadata['params'].items()))
+        traj.stage_params = dict((str(stage), dict((str(name), value) for name, value
+                                                   in params.items()))
+                                 for stage, params in metadata['stage_params'].items())
+        traj.lean = metadata['lean']
+        result = None
+        if metadata['result']:
+            result = gl.load_sframe(os.path.join(path, 'result'))
+        return traj, result
+
+    def set_params(self, params):
+        """
+        Parameters of the stages (see checkpoint.STAGE_PARAMS), set by find_migrants.
+        """
+        self.params = params
+        self.segment_params = dict((name, params[name]) for name in SEGMENT_PARAMS)
+
+    def is_computed(self, stage):
+        """
+        Whether the columns of stage are in user_traj, computed with the current parameters.
+        """
+        return (self.stage_params.get(stage) == stage_params(stage, self.params or DEFAULT_PARAMS)
+                and all(column in self.user_traj.column_names() for column in STAGE_COLUMNS[stage]))
+
+    def compute_stage(self, stage, checkpoint=None):
+        """
+        Add the columns of a stage of steps 1-6 (see checkpoint.STAGES) to user_traj,
+        after the stages it depends on (STAGE_DEPENDS), unless they are already
+        computed with the current parameters (those of find_migrants, or
+        DEFAULT_PARAMS before it). The later stages are not computed, so e.g.
+        output_segments(which_step=1) only runs steps 1-3.
+        """
+        if self.is_computed(stage):
+            return
+        for depend_stage in STAGE_DEPENDS[stage]:
+            self.compute_stage(depend_stage, checkpoint)
+        params = self.params or DEFAULT_PARAMS
+        # the segments are stored as flat lists of ints (see traj_utils.SEGMENT_DTYPE)
+        if stage == 'filled_record':
+            num_days_missing_gap = params['num_days_missing_gap']
+            self.user_traj['filled_record'] = self.user_traj['all_record'].apply(
+                lambda x: fill_missing_day(x, num_days_missing_gap)
+            )
+        elif stage == 'segment_over_prop':
+            small_seg_len = params['small_seg_len']
+            seg_prop = params['seg_prop']
+            self.user_traj['segment_dict'] = self.user_traj['filled_record'].apply(
+                lambda x: flatten_records(find_segment(x, small_seg_len)), dtype=list
+            )
+            self.user_traj['segment_over_prop'] = self.user_traj.apply(
+                lambda x: flatten_records(filter_seg_appear_prop(x, 'segment_dict', seg_prop)),
+                dtype=list
+            )
+            # number of locations with segments
+            self.user_traj['segment_over_prop_num'] = self.user_traj['segment_over_prop'].apply(num_locations)
+        elif stage == 'medium_segment':
+            self.user_traj['medium_segment'] = self.user_traj['segment_over_prop'].apply(
+                lambda x: flatten_records(join_segment_if_no_gap(x)), dtype=list
+            )
+            self.user_traj['medium_segment_num'] = self.user_traj['medium_segment'].apply(num_locations)
+        elif stage == 'long_seg':
+            min_overlap_part_len = params['min_overlap_part_len']
+            num_stayed_days_migrant = params['num_stayed_days_migrant']
+            self.user_traj['long_seg'] = self.user_traj.apply(
+                lambda x: flatten_records(change_overlap_segment(
+                    x,
+                    'medium_segment',
+                    min_overlap_part_len,
+                    num_stayed_days_migrant
+                )),
+                dtype=list
+            )
+            self.user_traj['long_seg_num'] = self.user_traj['long_seg'].apply(num_locations)
+        elif stage == 'migration_result':
+            # users with segments in less than two locations have no migration
+            min_overlap_part_len = params['min_overlap_part_len']
+            self.user_traj['migration_result'] = self.user_traj.apply(
+                lambda x: flatten_records(find_migration_by_segment(
+                    x['long_seg'], min_overlap_part_len)) if x['long_seg_num'] > 1 else [],
+                dtype=list
+            )
+        self.stage_params[stage] = stage_params(stage, params)
+        if checkpoint:
+            self.user_traj = checkpoint.save(stage, self.user_traj)
+
+    def prefilter(self, num_stayed_days_migrant=90, small_seg_len=30, seg_prop=0.6,
+                  min_overlap_part_len=0):
+        """
+        Remove the users who cannot be migrants under these parameters from user_traj,
+        using summary statistics of the raw records:
+
+        - A location needs at least seg_prop * small_seg_len records to have a segment
+          in step 3, and a migration needs segments in two locations.
+        - Two segments of num_stayed_days_migrant days that overlap by at most
+          min_overlap_part_len days need a span of 2 * num_stayed_days_migrant -
+          min_overlap_part_len days between the first and the last record.
+
+        The removed users are kept in pruned_user_traj, and are put back by
+        the next call of find_migrants, or by restore_pruned_users (called by
+        output_segments and save) with the stages computed for them.
+        """
+        user_columns = self.user_columns()
+        loc_count = self.raw_traj.groupby(
+            user_columns + ['location'],
+            {'num_record': gl.aggregate.COUNT()}
+        )
+        loc_count = loc_count[loc_count['num_record'] >= seg_prop * small_seg_len]
+        user_stat = loc_count.groupby(user_columns, {'num_location': gl.aggregate.COUNT()})
+        user_stat = user_stat[user_stat['num_location'] >= 2]
+        user_span = self.raw_traj.groupby(
+            user_columns,
+            {'first_day': gl.aggregate.MIN('date_num'),
+             'last_day': gl.aggregate.MAX('date_num')}
+        )
+        user_span = user_span[user_span['last_day'] - user_span['first_day'] + 1 >=
+                              2 * num_stayed_days_migrant - min_overlap_part_len]
+        candidate = user_stat.join(user_span, on=user_columns).select_columns(user_columns)
+        candidate['candidate'] = 1
+        user_traj = self.user_traj.join(candidate, on=user_columns, how='left').fillna('candidate', 0)
+        self.pruned_user_traj = user_traj[user_traj['candidate'] != 1].remove_column('candidate')
+        self.user_traj = user_traj[user_traj['candidate'] == 1].remove_column('candidate')
+        print('Pruned %d of %d users who cannot be migrants' % (
+            len(self.pruned_user_traj), len(self.pruned_user_traj) + len(self.user_traj)))
+
+    def restore_pruned_users(self):
+        """
+        Put the users removed by prefilter back in user_traj, with the columns
+        of the stages computed for the other users, so that their segments
+        are output and saved too.
+        """
+        if self.pruned_user_traj is None:
+            return
+        columns = self.user_columns() + ['all_record']
+        if 'cost' in self.user_traj.column_names():
+            columns.append('cost')
+        stages = [stage for stage in STAGES if STAGE_COLUMNS[stage] and self.is_computed(stage)]
+        stage_columns = [column for stage in stages for column in STAGE_COLUMNS[stage]]
+        if len(self.pruned_user_traj) > 0:
+            user_traj, computed_stage_params = self.user_traj, self.stage_params
+            # compute the same stages for the pruned users only
+            self.user_traj = self.pruned_user_traj.select_columns(columns)
+            self.stage_params = {}
+            for stage in stages:
+                self.compute_stage(stage)
+            pruned_user_traj = self.user_traj.select_columns(columns + stage_columns)
+            self.user_traj = user_traj.select_columns(columns + stage_columns).append(
+                pruned_user_traj)
+            self.stage_params = computed_stage_params
+        self.pruned_user_traj = None
 
-    def plot_trajectory(self, user_id, start_date=None, end_date=None, if_save=True, fig_path='figure'):
+    def level_raw_traj(self, level=None):
+        """
+        Raw records at one level of the locations (see read_csv location_levels).
+        """
+        if 'level' not in self.raw_traj.column_names():
+            return self.raw_traj
+        assert level is not None, "level is needed when the locations have several levels"
+        return self.raw_traj.filter_by([level], 'level')
+
+    def plot_trajectory(self, user_id, start_date=None, end_date=None, if_save=True, fig_path='figure',
+                        level=None):
         """
         Plot an individual's trajectory.
 
         Attributes
         ----------
         user_id : string
-            user id
+            user id (the original id, not its code)
         start_date : str
             start date of the figure in the format of 'YYYYMMDD'
         end_date : str
@@ -51,9 +362,15 @@ class TrajRecord():
             if save the figure
         fig_path : str
             the path to save figures
+        level : str
+            level of the locations to plot, if the locations have several levels
         """
-        date_min = self.raw_traj.filter_by(user_id, 'user_id')['date'].min()
-        date_max = self.raw_traj.filter_by(user_id, 'user_id')['date'].max()
+        user_code = user_id
+        if self.user_ids is not None:
+            user_code = self.user_ids.code(str(user_id))
+        raw_traj = self.level_raw_traj(level)
+        date_min = raw_traj.filter_by(user_code, 'user_id')['date'].min()
+        date_max = raw_traj.filter_by(user_code, 'user_id')['date'].max()
         if start_date:
             assert int(start_date) >= date_min, "start date must be later than the first day of this user's records, which is " + str(date_min)
             start_day = self.date_num_long.filter_by(int(start_date), 'date')['date_num'][0]
@@ -66,16 +383,21 @@ class TrajRecord():
         else:
             end_day = self.date_num_long.filter_by(date_max, 'date')['date_num'][0]
             end_date = str(self.date_num_long.filter_by(end_day, 'date_num')['date'][0])
-        fig, ax, _, _ = plot_traj_common(self.raw_traj, user_id, start_day, end_day, self.date_num_long)
+        from .plotting import plot_traj_common
+        fig, ax, _, _ = plot_traj_common(raw_traj, user_code, start_day, end_day, self.date_num_long,
+                                         self.locations)
         if not os.path.isdir(fig_path):
             os.makedirs(fig_path)
-        save_path = os.path.join(fig_path, user_id  + '_' + start_date + '-' + end_date + '_trajectory')
+        save_path = os.path.join(fig_path, str(user_id) + '_' + start_date + '-' + end_date + '_trajectory')
         if if_save:
             fig.savefig(save_path, bbox_inches="tight")
 
     def find_migrants(self, num_stayed_days_migrant=90, num_days_missing_gap=7,
                       small_seg_len=30, seg_prop=0.6, min_overlap_part_len=0,
-                      max_gap_home_des=30):
+                      max_gap_home_des=30, checkpoint_dir=None, prefilter=False,
+                      flows=None, lean=False, processes=None,
+                      hmin=0, hmax=float('inf'), dmin=0, dmax=float('inf'), decode=True,
+                      flows_only=False):
         """
         Find migrants step by step
 
@@ -105,16 +427,23 @@ class TrajRecord():
                   user_long_seg = user_loc_agg.filter_by([0,1],'long_seg_num',exclude=True)
                   find_migration_by_segment('long_seg',min_overlap_part_len) -> 'migration_result'
 
-        - step 7: Find migration day
-                  find_migration_day_segment(x)
-
-        - step 8: Filter migration segment
+        - step 7: Filter migration segment, before step 8 so that the migration
+                  day is only found for the migrations kept
                   a) The gap between home segment and destination segment <= 31 days.
-                  'seg_diff' <= 31  -> seg_migr_filter
+                  'seg_diff' <= 31
                   b) For short-term migration: Restriction on the length of home segment
                   and destination segment.
-                  filter_migration_segment_len('migration_list', hmin, hmax, dmin, dmax)
-                  -> 'flag_home_des_len' (0 or 1)
+                  hmin <= home_end - home_start + 1 <= hmax and
+                  dmin <= destination_end - destination_start + 1 <= dmax
+
+        - step 8: Find migration day
+                  find_migration_day_segment(x)
+
+                  Steps 7 and 8 run in one pass over the users:
+                  find_migration_events(x, max_gap_home_des, hmin, hmax, dmin, dmax)
+                  -> 'migration_event'
+                  expand_records(user_long_seg, ..., 'migration_event', MIGRATION_EVENT_DTYPE)
+                  -> one row per migration event, with all the columns of the result
 
         Attributes
         ----------
@@ -130,97 +459,134 @@ class TrajRecord():
             Overlap: 0 days
         max_gap_home_des : int
             Gaps beteen home segment and destination segment
+        checkpoint_dir : str
+            Local directory to save the completed steps in. A later run with
+            the same input data and parameters resumes from the last saved step,
+            and a run with changed parameters resumes from the last step that
+            does not depend on them.
+        prefilter : boolean
+            Skip the users who cannot be migrants before step 1 (see prefilter).
+            These users are not in user_traj and output_segments.
+        flows : FlowMatrix
+            Add the origin-destination flows of the migrations found to this
+            FlowMatrix, from the migrations of each user (see FlowMatrix.add_events)
+        lean : boolean
+            Only keep 'all_record', 'long_seg' and 'long_seg_num' in user_traj, and
+            the columns of to_csv (with 'migration_day' and 'all_record') in the result.
+            The other segments are computed again for the users that need them
+            (see output_segments and plot_segment).
+        processes : int
+            Run steps 1-5 in this many processes, with the users bin-packed into
+            tasks of balanced cost (see schedule.py), and print the time of each task.
+            By default, the steps run as SFrame apply.
+        hmin, hmax : int
+            Short-term migration: only keep migrations with a home segment of
+            hmin to hmax days (step 7 b)
+        dmin, dmax : int
+            Short-term migration: only keep migrations with a destination segment of
+            dmin to dmax days (step 7 b)
+        decode : boolean
+            Give the original user ids and locations in 'user_id', 'home' and
+            'destination' (see decode), with the code of the user in 'user_code'
+            (for plot_segment). If False, the result has the codes, to be
+            decoded by to_csv(result, traj=traj) or decode.
+        flows_only : boolean
+            With flows, only add the flows and return None, without building
+            the table of the migration events (e.g. with lean, for a large input).
         """
-        self.user_traj['filled_record'] = self.user_traj['all_record'].apply(
-            lambda x: fill_missing_day(x, num_days_missing_gap)
-        )
-        self.user_traj['segment_dict'] = self.user_traj['filled_record'].apply(
-            lambda x: find_segment(x, small_seg_len)
-        )
-        self.user_traj['segment_over_prop'] = self.user_traj.apply(
-            lambda x: filter_seg_appear_prop(x, 'segment_dict', seg_prop)
-        )
-        self.user_traj['medium_segment'] = self.user_traj['segment_over_prop'].apply(
-            lambda x: join_segment_if_no_gap(x)
-        )
+        assert flows is not None or not flows_only, "flows_only needs flows"
+        if self.pruned_user_traj is not None:
+            columns = self.user_columns() + ['all_record']
+            if 'cost' in self.user_traj.column_names():
+                columns.append('cost')
+            self.user_traj = self.user_traj.select_columns(columns).append(
+                self.pruned_user_traj.select_columns(columns))
+            self.pruned_user_traj = None
+        params = {
+            'num_stayed_days_migrant': num_stayed_days_migrant,
+            'num_days_missing_gap': num_days_missing_gap,
+            'small_seg_len': small_seg_len,
+            'seg_prop': seg_prop,
+            'min_overlap_part_len': min_overlap_part_len,
+            # the users kept by prefilter depend on these thresholds
+            'prefilter': [seg_prop * small_seg_len,
+                          2 * num_stayed_days_migrant - min_overlap_part_len] if prefilter else None,
+        }
+        self.set_params(params)
+        self.lean = lean
+        if prefilter:
+            self.prefilter(num_stayed_days_migrant, small_seg_len, seg_prop,
+                           min_overlap_part_len)
+        checkpoint = None
+        if checkpoint_dir:
+            checkpoint = StageCheckpoint(checkpoint_dir, self.fingerprint, params)
+            resume_stage = checkpoint.resume_stage()
+            if resume_stage is not None:
+                print('Resume from the checkpoint of ' + resume_stage)
+                self.user_traj = checkpoint.load(resume_stage)
+                for stage in STAGES[:STAGES.index(resume_stage) + 1]:
+                    self.stage_params[stage] = stage_params(stage, params)
+
+        if processes and not self.is_computed('long_seg'):
+            self.user_traj = compute_segments_parallel(self.user_traj, self.user_columns(),
+                                                       self.segment_params, processes)
+            for stage in STAGES[:STAGES.index('long_seg') + 1]:
+                self.stage_params[stage] = stage_params(stage, params)
+            if checkpoint:
+                self.user_traj = checkpoint.save('long_seg', self.user_traj)
         print('Start: Detecting migration')
-        self.user_traj['long_seg'] = self.user_traj.apply(
-            lambda x: change_overlap_segment(
-                x,
-                'medium_segment',
-                min_overlap_part_len,
-                num_stayed_days_migrant
-            )
-        )
-        self.user_traj['long_seg_num'] = self.user_traj['long_seg'].apply(lambda x: len(x))
-        self.user_traj['medium_segment_num'] = self.user_traj['medium_segment'].apply(lambda x: len(x))
-        self.user_traj['segment_over_prop_num'] = self.user_traj['segment_over_prop'].apply(lambda x: len(x))
+        self.compute_stage('migration_result', checkpoint)
 
         # filter out those users with no record or only one location in ['long_seg]
         user_long_seg = self.user_traj.filter_by([0, 1], 'long_seg_num', exclude=True)
-        user_long_seg['migration_result'] = user_long_seg['long_seg'].apply(
-            lambda x: find_migration_by_segment(x, min_overlap_part_len)
+        user_columns = self.user_columns()
+        if lean:
+            self.user_traj = self.user_traj.select_columns(
+                user_columns + ['all_record', 'long_seg', 'long_seg_num'])
+            self.stage_params = {'long_seg': self.stage_params['long_seg']}
+            user_long_seg = user_long_seg.select_columns(
+                user_columns + ['all_record', 'migration_result'])
+        # steps 7 and 8 in one pass over the users, then one row per migration
+        user_long_seg['migration_event'] = user_long_seg.apply(
+            lambda x: flatten_records(find_migration_events(x, max_gap_home_des,
+                                                            hmin, hmax, dmin, dmax)),
+            dtype=list
         )
-        migrant_size = [len(m) for m in user_long_seg['migration_result']]
-        if len(migrant_size) == 0:
+        if flows is not None:
+            flows.add_events(user_long_seg, self.index2date, self)
+        if flows_only:
+            print('Done')
+            return None
+        seg_migr_filter = expand_records(user_long_seg, user_columns, 'migration_event',
+                                         MIGRATION_EVENT_DTYPE)
+        if len(seg_migr_filter) == 0:
             print('No migrants are found.')
             return None
-        user_seg_migr = user_long_seg.stack(
-            'migration_result',
-            new_column_name='migration_list'
-        )
-        user_seg_migr = user_seg_migr.dropna('migration_list')
-
-        user_seg_migr['migration_segment'] = user_seg_migr['migration_list'].apply(
-            lambda x: create_migration_dict(x)
-        )
-        user_seg_migr['home'] = user_seg_migr['migration_list'].apply(lambda x: x[2])
-        user_seg_migr['destination'] = user_seg_migr['migration_list'].apply(
-            lambda x: x[3]
-        )
-
-        user_seg_migr['migration_day_result'] = user_seg_migr.apply(
-            lambda x: find_migration_day_segment(x)
-        )
-
-        user_seg_migrs = user_seg_migr.unpack('migration_day_result')
-        user_seg_migrs.rename({'migration_day_result.0': 'migration_day',
-                               'migration_day_result.1': 'num_error_day'})
-
-        user_seg_migrs['migration_day'] = user_seg_migrs['migration_day'].apply(
-            lambda x: int(x)
-        )
-        user_seg_migrs['migration_date'] = user_seg_migrs.apply(
-            lambda x: self.index2date[x['migration_day']]
-        )
-        user_seg_migrs['home_start'] = user_seg_migrs['migration_list'].apply(
-            lambda x: x[0][0]
-        )
-        user_seg_migrs['destination_end'] = user_seg_migrs['migration_list'].apply(
-            lambda x: x[1][1]
-        )
-        user_seg_migrs['home_end'] = user_seg_migrs['migration_list'].apply(
-            lambda x: x[0][1]
-        )
-        user_seg_migrs['destination_start'] = user_seg_migrs['migration_list'].apply(
-            lambda x: x[1][0]
-        )
-        user_seg_migrs['home_start_date'] = user_seg_migrs.apply(
-            lambda x: self.index2date[x['home_start']]
-        )
-        user_seg_migrs['home_end_date'] = user_seg_migrs.apply(
-            lambda x: self.index2date[x['home_end']]
-        )
-        user_seg_migrs['destination_start_date'] = user_seg_migrs.apply(
-            lambda x: self.index2date[x['destination_start']]
-        )
-        user_seg_migrs['destination_end_date'] = user_seg_migrs.apply(
-            lambda x: self.index2date[x['destination_end']]
-        )
-        user_seg_migrs['seg_diff'] = (user_seg_migrs['destination_start'] -
-                                      user_seg_migrs['home_end'])
-        seg_migr_filter = user_seg_migrs[user_seg_migrs['seg_diff'] <= max_gap_home_des]
+        date_of_day = np.array([self.index2date[day] for day in range(len(self.index2date))])
+        for day_column, date_column in [('migration_day', 'migration_date'),
+                                        ('home_start', 'home_start_date'),
+                                        ('home_end', 'home_end_date'),
+                                        ('destination_start', 'destination_start_date'),
+                                        ('destination_end', 'destination_end_date')]:
+            seg_migr_filter[date_column] = gl.SArray(
+                date_of_day[seg_migr_filter[day_column].to_numpy()])
         seg_migr_filter['uncertainty'] = seg_migr_filter['seg_diff'] - 1
+        seg_migr_filter = seg_migr_filter.join(
+            user_long_seg.select_columns([column for column in user_long_seg.column_names()
+                                          if column not in ['migration_result', 'migration_event']]),
+            on=user_columns)
+        if lean:
+            seg_migr_filter = seg_migr_filter.select_columns(
+                self.user_columns() +
+                ['home', 'destination', 'migration_date', 'migration_day',
+                 'uncertainty', 'num_error_day',
+                 'home_start', 'home_end',
+                 'destination_start', 'destination_end',
+                 'home_start_date', 'home_end_date',
+                 'destination_start_date', 'destination_end_date', 'all_record'])
+        if decode:
+            seg_migr_filter['_user_code'] = seg_migr_filter['user_id']
+            seg_migr_filter = self.decode(seg_migr_filter).rename({'_user_code': 'user_code'})
         print('Done')
         return seg_migr_filter
 
@@ -238,29 +604,25 @@ class TrajRecord():
         which_step : int
             Output segments in which step
         """
-        if which_step == 3:
-            user_seg = self.user_traj[self.user_traj['long_seg_num'] > 0]
-            user_seg['seg_selected'] = user_seg['long_seg']
-        elif which_step == 2:
-            user_seg = self.user_traj[self.user_traj['medium_segment_num'] > 0]
-            user_seg['seg_selected'] = user_seg['medium_segment']
-        elif which_step == 1:
-            user_seg = self.user_traj[self.user_traj['segment_over_prop_num'] > 0]
-            user_seg['seg_selected'] = user_seg['segment_over_prop']
-        user_seg_migr = user_seg.stack(
-            'seg_selected',
-            new_column_name=['location', 'migration_list']
-        )
-        user_seg_migr = user_seg_migr.stack(
-            'migration_list',
-            new_column_name='segment'
-        )
-        user_seg_migr['segment_start'] = user_seg_migr['segment'].apply(
-            lambda x: x[0]
-        )
-        user_seg_migr['segment_end'] = user_seg_migr['segment'].apply(
-            lambda x: x[1]
-        )
+        # the stages of steps 1-5 are named after their segment column
+        segment_column = SEGMENT_STEP_COLUMN[which_step]
+        self.restore_pruned_users()
+        if self.lean and not self.is_computed(segment_column):
+            # lean mode: compute the segments of this step again, without keeping them
+            segment_params = dict(self.segment_params, until=segment_column)
+            user_seg = self.user_traj.select_columns(self.user_columns() + ['all_record'])
+            user_seg['seg_selected'] = user_seg['all_record'].apply(
+                lambda x: flatten_records(compute_segments(x, **segment_params)[segment_column]),
+                dtype=list
+            )
+            user_seg = user_seg[user_seg['seg_selected'].item_length() > 0]
+        else:
+            self.compute_stage(segment_column)
+            user_seg = self.user_traj[self.user_traj[segment_column + '_num'] > 0]
+            user_seg['seg_selected'] = user_seg[segment_column]
+        user_seg_migr = expand_records(user_seg, self.user_columns(), 'seg_selected',
+                                       SEGMENT_DTYPE)
+        user_seg_migr.rename({'start': 'segment_start', 'end': 'segment_end'})
         user_seg_migr['segment_start_date'] = user_seg_migr.apply(
             lambda x: self.index2date[x['segment_start']]
         )
@@ -269,12 +631,17 @@ class TrajRecord():
         )
         user_seg_migr['segment_length'] = (user_seg_migr['segment_end'] -
                                            user_seg_migr['segment_start'])
-        user_seg_migr = user_seg_migr.sort(['user_id', 'segment_start_date'], ascending=True)
+        user_seg_migr = self.decode(user_seg_migr)
+        user_columns = ['user_id']
+        if 'level' in user_seg_migr.column_names():
+            user_columns = ['user_id', 'level']
+        user_seg_migr = user_seg_migr.sort(user_columns + ['segment_start_date'], ascending=True)
         if not os.path.isdir(result_path):
             os.makedirs(result_path)
         save_file = os.path.join(result_path, segment_file)
         user_seg_migr.select_columns(
-            ['user_id', 'location',
+            user_columns +
+            ['location',
              'segment_start_date', 'segment_end_date', 'segment_length']
         ).export_csv(save_file)
 
@@ -310,8 +677,19 @@ class TrajRecord():
             2: 'medium_segment',
             3: 'long_seg'
         }
-        user_id = user_result['user_id']
-        plot_segment = user_result[segment_which_step_dict[segment_which_step]]
+        # the rows of a decoded result of find_migrants keep the code in 'user_code'
+        user_id = user_result.get('user_code', user_result['user_id'])
+        raw_traj = self.level_raw_traj(user_result.get('level'))
+        segment_column = segment_which_step_dict[segment_which_step]
+        if segment_column not in user_result:
+            # lean mode or before find_migrants: compute the segments of this user
+            segment_params = dict(self.segment_params or
+                                  dict((name, DEFAULT_PARAMS[name]) for name in SEGMENT_PARAMS),
+                                  until=segment_column)
+            plot_segment = segment_dict(compute_segments(user_result['all_record'],
+                                                         **segment_params)[segment_column])
+        else:
+            plot_segment = segment_dict(user_result[segment_column])
         if if_migration:
             migration_day = user_result['migration_day']
             home_start = int(user_result['home_start'])
@@ -329,8 +707,8 @@ class TrajRecord():
             start_date = str(self.date_num_long.filter_by(start_day, 'date_num')['date'][0])
             end_date = str(self.date_num_long.filter_by(end_day, 'date_num')['date'][0])
         else:
-            date_min = self.raw_traj.filter_by(user_id, 'user_id')['date'].min()
-            date_max = self.raw_traj.filter_by(user_id, 'user_id')['date'].max()
+            date_min = raw_traj.filter_by(user_id, 'user_id')['date'].min()
+            date_max = raw_traj.filter_by(user_id, 'user_id')['date'].max()
             if start_date:
                 assert int(start_date) >= date_min, "start date must be later than the first day of this user's records, which is " + str(date_min)
                 start_day = self.date_num_long.filter_by(int(start_date), 'date')['date_num'][0]
@@ -345,24 +723,17 @@ class TrajRecord():
                 end_date = str(self.date_num_long.filter_by(end_day, 'date_num')['date'][0])
 
         duration = end_day - start_day + 1
-        fig, ax, location_y_order_loc_appear, appear_loc = plot_traj_common(self.raw_traj, user_id, start_day, end_day, self.date_num_long)
+        from .plotting import plot_traj_common, add_segment_patch
+        fig, ax, location_y_order_loc_appear, appear_loc = plot_traj_common(raw_traj, user_id, start_day, end_day, self.date_num_long,
+                                                                            self.locations)
         plot_appear_segment = {k: v for k, v in plot_segment.items() if k in appear_loc}
-        for location, value in plot_appear_segment.items():
-            y_min = location_y_order_loc_appear[location]
-            for segment in value:
-                seg_start = segment[0]
-                seg_end = segment[1]
-                ax.add_patch(
-                    patches.Rectangle((seg_start - start_day, y_min),
-                                      seg_end - seg_start + 1, 1,
-                                      linewidth=4,
-                                      edgecolor='red',
-                                      facecolor='none')
-                )
+        add_segment_patch(ax, plot_appear_segment, location_y_order_loc_appear, start_day)
         if if_migration:
             ax.axvline(migration_day + 0.5 - start_day, color='orange', linewidth=4)
         if not os.path.isdir(fig_path):
             os.makedirs(fig_path)
-        save_file = os.path.join(fig_path, user_id + '_' + start_date + '-' + end_date + '_segment')
+        if self.user_ids is not None:
+            user_id = self.user_ids.value(user_id)
+        save_file = os.path.join(fig_path, str(user_id) + '_' + start_date + '-' + end_date + '_segment')
         if if_save:
             fig.savefig(save_file, bbox_inches="tight")
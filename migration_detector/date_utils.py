@@ -0,0 +1,65 @@
+def date_to_day(date):
+    """
+    Convert dates in the format of YYYYMMDD (int) to the number of days
+    since 1970-01-01.
+
+    Only integer arithmetic is used, so date can be an int, a numpy array
+    or a gl.SArray, and whole columns are converted at once.
+    """
+    year = date // 10000
+    month = date // 100 % 100
+    day = date % 100
+    # count years from March so that the leap day is the last day of a year
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    day_of_era = (year_of_era * 365 + year_of_era // 4 -
+                  year_of_era // 100 + day_of_year)
+    return era * 146097 + day_of_era - 719468
+
+
+def day_to_date(day):
+    """
+    Convert the number of days since 1970-01-01 to dates in the format of
+    YYYYMMDD (int). This is the inverse of date_to_day.
+    """
+    day = day + 719468
+    era = day // 146097
+    day_of_era = day - era * 146097
+    year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 -
+                   day_of_era // 146096) // 365
+    day_of_year = day_of_era - (year_of_era * 365 + year_of_era // 4 -
+                                year_of_era // 100)
+    month_from_march = (5 * day_of_year + 2) // 153
+    day_of_month = day_of_year - (153 * month_from_march + 2) // 5 + 1
+    month = (month_from_march + 2) % 12 + 1
+    year = year_of_era + era * 400 + (month <= 2)
+    return year * 10000 + month * 100 + day_of_month
+
+
+def shift_night_date(date, hour, last_night_hour=8):
+    """
+    Assign the records before (and including) last_night_hour to the previous day,
+    so that a night from the evening to the next morning belongs to one date.
+    """
+    return day_to_date(date_to_day(date) - (hour <= last_night_hour))
+
+
+def month_index(date, start_year):
+    """
+    Index of the month of date, counted from January of start_year (= 1).
+    """
+    return date // 100 % 100 + 12 * (date // 10000 - start_year)
+
+
+def month_length(month_idx, start_year):
+    """
+    Number of days in the month of month_idx (see month_index).
+    """
+    month_start = month_idx - 1 + 12 * start_year
+    next_month_start = month_start + 1
+    first_day = date_to_day((month_start // 12) * 10000 + (month_start % 12 + 1) * 100 + 1)
+    next_first_day = date_to_day((next_month_start // 12) * 10000 +
+                                 (next_month_start % 12 + 1) * 100 + 1)
+    return next_first_day - first_day
@@ -0,0 +1,63 @@
+import graphlab as gl
+
+
+class Dictionary():
+    """
+    Dictionary encoding of a column: each distinct value gets a dense int code.
+
+    By default the values are sorted before they are numbered, so sorting by
+    the codes gives the same order as sorting by the values.
+    """
+    def __init__(self, values, sort=True):
+        """
+        Attributes
+        ----------
+        values : gl.SArray
+            Values of the column to encode, with duplicates
+        sort : boolean
+            if False, values must be distinct and value i gets code i
+            (for codes assigned while reading, see read_csv_external)
+        """
+        if sort:
+            values = values.unique().sort()
+        self.table = gl.SFrame({'value': values,
+                                'code': gl.SArray.from_sequence(len(values))})
+
+    def __len__(self):
+        return len(self.table)
+
+    def encode(self, sf, column):
+        """
+        Replace the values in column of sf by their codes.
+        The order of the rows is not kept.
+        """
+        return self._replace(sf, column, 'value', 'code')
+
+    def decode(self, sf, column):
+        """
+        Replace the codes in column of sf by their values.
+        The order of the rows is not kept.
+        """
+        return self._replace(sf, column, 'code', 'value')
+
+    def _replace(self, sf, column, key, replacement):
+        column_names = sf.column_names()
+        table = self.table.select_columns([key, replacement])
+        table.rename({key: column, replacement: '_replacement'})
+        sf = sf.join(table, on=column, how='left')
+        sf = sf.remove_column(column).rename({'_replacement': column})
+        return sf.select_columns(column_names)
+
+    def code(self, value):
+        """
+        Code of a single value.
+        """
+        codes = self.table.filter_by([value], 'value')['code']
+        assert len(codes) > 0, str(value) + " is not in the data"
+        return codes[0]
+
+    def value(self, code):
+        """
+        Value of a single code.
+        """
+        return self.table['value'][code]
@@ -0,0 +1,314 @@
+"""
+Out-of-core ingestion of trajectory files larger than the memory.
+
+The csv file is read in chunks. Each chunk is encoded to
+(user number in the chunk, location code, day) records, sorted and written
+to a temporary file (a sorted run), with the sorted user ids of the chunk
+next to it. The user ids of the runs are merged into the user codes, then
+the runs are merged block by block into the per-user 'all_record' layout
+that TrajRecord.find_migrants consumes, so only one chunk or one block per
+run is in memory at a time. Only the location codes are kept in memory
+(there are few locations: towers or districts).
+"""
+import heapq
+import itertools
+import os
+import shutil
+import tempfile
+from array import array
+import numpy as np
+import graphlab as gl
+from .core import TrajRecord
+from .date_utils import date_to_day, day_to_date
+from .checkpoint import file_fingerprint
+from .file_io import expand_paths, filter_fingerprint
+from .encoding import Dictionary
+from .runtime import parse_size
+
+RECORD_DTYPE = np.dtype([('user_id', '<i4'), ('location', '<i4'), ('day', '<i4')])
+# Rough memory used by one record while parsing a chunk and while merging
+PARSE_RECORD_BYTES = 200
+MERGE_RECORD_BYTES = 64
+# Codes of the users of a run buffered before they are written
+CODE_BUFFER = 1 << 16
+
+
+def encode_chunk(values, codes):
+    """
+    Codes of values; new values are added to codes (dict: value -> code).
+    """
+    import pandas as pd
+    chunk_codes, uniques = pd.factorize(values)
+    unique_codes = np.empty(len(uniques), dtype=np.int32)
+    for i, value in enumerate(uniques):
+        code = codes.get(value)
+        if code is None:
+            code = len(codes)
+            codes[value] = code
+        unique_codes[i] = code
+    return unique_codes[chunk_codes]
+
+
+def write_sorted_runs(file_paths, run_dir, chunk_records, location_codes,
+                      start_date=None, end_date=None):
+    """
+    Read the files in chunks and write each chunk as a run of records
+    sorted by (user_id, location, day), keeping the records from start_date
+    to end_date (YYYYMMDD) if they are given.
+
+    The users of a run are numbered in the order of their ids, and their ids
+    are written to run_path + '.users', one per line.
+
+    Return the paths of the runs and the first and last day of the records.
+    """
+    import pandas as pd
+    run_paths = []
+    first_day = None
+    last_day = None
+    chunks = (chunk for file_path in file_paths
+              for chunk in pd.read_csv(file_path, usecols=['user_id', 'date', 'location'],
+                                       dtype={'user_id': str}, chunksize=chunk_records))
+    for chunk in chunks:
+        if start_date is not None:
+            chunk = chunk[chunk['date'] >= start_date]
+        if end_date is not None:
+            chunk = chunk[chunk['date'] <= end_date]
+        if len(chunk) == 0:
+            continue
+        run_users, user_id = np.unique(chunk['user_id'].values, return_inverse=True)
+        location = encode_chunk(chunk['location'].values, location_codes)
+        day = date_to_day(chunk['date'].values.astype(np.int64))
+        order = np.lexsort((day, location, user_id))
+        records = np.empty(len(chunk), dtype=RECORD_DTYPE)
+        records['user_id'] = user_id[order]
+        records['location'] = location[order]
+        records['day'] = day[order]
+        run_path = os.path.join(run_dir, 'run_%d' % len(run_paths))
+        records.tofile(run_path)
+        with open(run_path + '.users', 'w') as f:
+            for value in run_users:
+                f.write(value + '\n')
+        run_paths.append(run_path)
+        first_day = day.min() if first_day is None else min(first_day, day.min())
+        last_day = day.max() if last_day is None else max(last_day, day.max())
+    assert run_paths, "no records in %s from %s to %s" % (file_paths, start_date, end_date)
+    return run_paths, int(first_day), int(last_day)
+
+
+def merge_user_ids(run_paths, user_path):
+    """
+    Merge the sorted user ids of the runs into user_path, one distinct id
+    per line: the code of a user is its line. The codes of the users of
+    each run are written to run_path + '.codes' (int32, by user number in
+    the run).
+
+    Return the number of users.
+    """
+    files = [open(run_path + '.users') for run_path in run_paths]
+    code_files = [open(run_path + '.codes', 'wb') for run_path in run_paths]
+    try:
+        run_ids = [itertools.izip((line.rstrip('\n') for line in f), itertools.repeat(i))
+                   for i, f in enumerate(files)]
+        codes = [array('i') for _ in run_paths]
+        num_users = 0
+        last_value = None
+        with open(user_path, 'w') as user_file:
+            for value, i in heapq.merge(*run_ids):
+                if value != last_value:
+                    user_file.write(value + '\n')
+                    last_value = value
+                    num_users += 1
+                codes[i].append(num_users - 1)
+                if len(codes[i]) >= CODE_BUFFER:
+                    codes[i].tofile(code_files[i])
+                    del codes[i][:]
+        for i, code_file in enumerate(code_files):
+            codes[i].tofile(code_file)
+    finally:
+        for f in files + code_files:
+            f.close()
+    return num_users
+
+
+class RecordKey():
+    """
+    Pack (user_id, location, day) into one int64 that sorts the same way.
+    """
+    def __init__(self, num_users, num_locations, first_day, last_day):
+        self.first_day = first_day
+        self.day_bits = int(last_day - first_day).bit_length()
+        self.location_bits = int(num_locations - 1).bit_length()
+        user_bits = int(num_users - 1).bit_length()
+        assert user_bits + self.location_bits + self.day_bits <= 63, \
+            "too many users, locations and days to pack in a 64-bit key"
+
+    def pack(self, records):
+        key = records['user_id'].astype(np.int64) << (self.location_bits + self.day_bits)
+        key |= records['location'].astype(np.int64) << self.day_bits
+        key |= records['day'].astype(np.int64) - self.first_day
+        return key
+
+    def unpack(self, key):
+        user_id = key >> (self.location_bits + self.day_bits)
+        location = (key >> self.day_bits) & ((1 << self.location_bits) - 1)
+        day_num = key & ((1 << self.day_bits) - 1)
+        return user_id, location, day_num
+
+
+def read_run_block(f, user_codes, record_key, block_records):
+    """
+    Packed keys of the next block_records records of a run, with the user
+    codes of merge_user_ids (they keep the order of the user numbers).
+    """
+    records = np.fromfile(f, dtype=RECORD_DTYPE, count=block_records)
+    records['user_id'] = user_codes[records['user_id']]
+    return record_key.pack(records)
+
+
+def merge_runs(run_paths, record_key, block_records):
+    """
+    k-way merge of the sorted runs. Yield the packed keys in sorted blocks.
+
+    Each run is read block_records at a time. All the keys up to the smallest
+    last key of the buffers are already in the buffers, so they can be sorted
+    and emitted together.
+    """
+    files = [open(run_path, 'rb') for run_path in run_paths]
+    user_codes = [np.memmap(run_path + '.codes', dtype=np.int32, mode='r')
+                  for run_path in run_paths]
+    try:
+        buffers = [read_run_block(f, codes, record_key, block_records)
+                   for f, codes in zip(files, user_codes)]
+        while True:
+            active = [i for i in range(len(files)) if len(buffers[i]) > 0]
+            if not active:
+                break
+            bound = min(buffers[i][-1] for i in active)
+            block = []
+            for i in active:
+                n = np.searchsorted(buffers[i], bound, side='right')
+                block.append(buffers[i][:n])
+                buffers[i] = buffers[i][n:]
+                if len(buffers[i]) == 0:
+                    buffers[i] = read_run_block(files[i], user_codes[i], record_key,
+                                                block_records)
+            block = np.concatenate(block)
+            block.sort()
+            yield block
+    finally:
+        for f in files:
+            f.close()
+
+
+def block_to_traj(user_id, location, date_num):
+    """
+    Per-user 'all_record' ({location: [date_num, ...]}) of sorted records.
+    """
+    pair_start = np.flatnonzero(np.r_[True, (user_id[1:] != user_id[:-1]) |
+                                      (location[1:] != location[:-1])])
+    pair_dates = [dates.tolist() for dates in np.split(date_num, pair_start[1:])]
+    # list dtype keeps the dates as lists of int, like CONCAT in read_csv
+    user_loc_date_agg = gl.SFrame({'user_id': user_id[pair_start],
+                                   'location': location[pair_start],
+                                   'all_date': gl.SArray(pair_dates, dtype=list)})
+    # the users of a block are complete, so grouping the block is enough
+    return user_loc_date_agg.groupby(
+        ['user_id'],
+        {'all_record': gl.aggregate.CONCAT('location', 'all_date')}
+    )
+
+
+def append_block(user_loc_agg, raw_traj, user_id, location, date_num, start_day):
+    """
+    Append the complete users of a merged block to user_loc_agg and raw_traj.
+    """
+    block_traj = block_to_traj(user_id, location, date_num)
+    block_raw = gl.SFrame({'user_id': user_id,
+                           'date': day_to_date(date_num + start_day),
+                           'location': location,
+                           'date_num': date_num})
+    block_raw = block_raw.select_columns(['user_id', 'date', 'location', 'date_num'])
+    if user_loc_agg is None:
+        return block_traj, block_raw
+    return user_loc_agg.append(block_traj), raw_traj.append(block_raw)
+
+
+def read_csv_external(file_path, memory_limit='1GB', tmp_dir=None, start_date=None,
+                      end_date=None):
+    """
+    Read a trajectory file that does not fit in memory, like read_csv.
+
+    Attributes
+    ----------
+    file_path : str
+        csv file with the columns user_id, date (YYYYMMDD) and location,
+        or a directory, a glob pattern or a list of them (see read_csv)
+    memory_limit : int or str
+        Memory to use for parsing and merging, e.g. '4GB'. The user ids are
+        sorted on disk; only the locations are kept in memory.
+    tmp_dir : str
+        Directory of the temporary sorted runs (default: the system temp directory)
+    start_date, end_date : int
+        Only read the records of this date window (YYYYMMDD), and pin the
+        day index to it like read_csv (e.g. to the dates of all the shards)
+    """
+    memory_limit = parse_size(memory_limit)
+    run_dir = tempfile.mkdtemp(prefix='migration_detector_', dir=tmp_dir)
+    try:
+        location_codes = {}
+        file_paths = expand_paths(file_path)
+        run_paths, start_day, end_day = write_sorted_runs(
+            file_paths, run_dir, max(1, memory_limit // PARSE_RECORD_BYTES),
+            location_codes, start_date, end_date)
+        user_path = os.path.join(run_dir, 'users')
+        num_users = merge_user_ids(run_paths, user_path)
+        # the codes follow the order of the ids, like the Dictionary of read_csv
+        user_ids = Dictionary(gl.SArray(user_path), sort=False)
+        if start_date is not None:
+            start_day = int(date_to_day(start_date))
+        if end_date is not None:
+            end_day = int(date_to_day(end_date))
+        record_key = RecordKey(num_users, len(location_codes), start_day, end_day)
+        block_records = max(1, memory_limit // (MERGE_RECORD_BYTES * len(run_paths)))
+
+        user_loc_agg = None
+        raw_traj = None
+        pending = np.array([], dtype=np.int64)
+        for block in merge_runs(run_paths, record_key, block_records):
+            block = np.concatenate([pending, block])
+            user_id, location, date_num = record_key.unpack(block)
+            # the last user may continue in the next block
+            last_user_start = np.searchsorted(user_id, user_id[-1])
+            pending = block[last_user_start:]
+            if last_user_start == 0:
+                continue
+            user_id = user_id[:last_user_start]
+            location = location[:last_user_start]
+            date_num = date_num[:last_user_start]
+            user_loc_agg, raw_traj = append_block(user_loc_agg, raw_traj, user_id,
+                                                  location, date_num, start_day)
+        if len(pending) > 0:
+            user_id, location, date_num = record_key.unpack(pending)
+            user_loc_agg, raw_traj = append_block(user_loc_agg, raw_traj, user_id,
+                                                  location, date_num, start_day)
+    finally:
+        shutil.rmtree(run_dir)
+
+    # Assign day index to each date
+    all_date_new = [day_to_date(day) for day in range(start_day, end_day + 1)]
+    index2date = dict(zip(range(len(all_date_new)), all_date_new))
+    all_date_long_new = [day_to_date(day) for day in range(start_day, end_day + 200 + 1)]
+    date_num_long = gl.SFrame({'date': all_date_long_new,
+                               'date_num': range(len(all_date_long_new))})
+
+    locations = Dictionary(gl.SArray(sorted(location_codes, key=location_codes.get)), sort=False)
+    filters = dict((name, value) for name, value in
+                   [('start_date', start_date), ('end_date', end_date)] if value is not None)
+    fingerprint_options = {'reader': 'external'}
+    if filters:
+        fingerprint_options['filters'] = filter_fingerprint(filters)
+    traj = TrajRecord(user_loc_agg, raw_traj, index2date, date_num_long,
+                      fingerprint=file_fingerprint(file_paths, **fingerprint_options),
+                      user_ids=user_ids, locations=locations)
+    return traj
+
@@ -1,31 +1,189 @@
+from __future__ import print_function
 import graphlab as gl
-import pandas as pd
-import numpy as np
+import glob
+import hashlib
+import json
 import os
+import zlib
+import numpy as np
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 from .core import TrajRecord
+from .date_utils import date_to_day, day_to_date, shift_night_date
+from .checkpoint import file_fingerprint
+from .encoding import Dictionary
+from .frequency_based import NIGHT_HOURS
+from .hierarchy import roll_up_locations
+from .runtime import parse_size
+from .schedule import user_cost
+
+# Rough memory used by one hourly record while parsing a chunk
+HOURLY_RECORD_BYTES = 200
+
+
+def expand_paths(file_path):
+    """
+    Files of file_path: a file, a directory (its .csv files), a glob pattern,
+    or a list of them.
+    """
+    if isinstance(file_path, (list, tuple)):
+        return [path for one_path in file_path for path in expand_paths(one_path)]
+    if os.path.isdir(file_path):
+        file_paths = sorted(glob.glob(os.path.join(file_path, '*.csv')))
+    elif glob.has_magic(file_path):
+        file_paths = sorted(glob.glob(file_path))
+    else:
+        file_paths = [file_path]
+    assert len(file_paths) > 0, "no input files in " + str(file_path)
+    return file_paths
+
+
+def has_records(file_path):
+    """
+    Whether the csv files of file_path (see expand_paths) have any line after
+    their header, e.g. a shard of partition_csv may have no users.
+    """
+    for path in expand_paths(file_path):
+        with open(path) as f:
+            f.readline()
+            if f.readline().strip():
+                return True
+    return False
+
+
+def user_hash(user_id):
+    """
+    Stable 32-bit hash of a user id, the same on every machine and run
+    (for sampling and partitioning users).
+    """
+    return zlib.crc32(str(user_id)) & 0xffffffff
+
+
+def filter_records(records, users=None, sample=None, start_date=None, end_date=None,
+                   locations=None):
+    """
+    Keep the records of the given users, of a sample of the users, within a
+    date window and at the given locations (see read_csv).
+    """
+    if users is not None:
+        records = records.filter_by([str(user_id) for user_id in users], 'user_id')
+    if sample is not None:
+        assert 0 < sample <= 1, "sample must be a fraction of the users in (0, 1]"
+        threshold = sample * 2 ** 32
+        records = records[records['user_id'].apply(lambda x: user_hash(x) < threshold)]
+    if start_date is not None:
+        records = records[records['date'] >= start_date]
+    if end_date is not None:
+        records = records[records['date'] <= end_date]
+    if locations is not None:
+        location_type = records['location'].dtype()
+        records = records.filter_by([location_type(location) for location in locations],
+                                    'location')
+    return records
+
+
+def read_partition(file_path, filters=None):
+    """
+    Read one input file and filter it (see filter_records), with its first and last date.
+    """
+    partition = gl.SFrame.read_csv(file_path, verbose=False)
+    partition['user_id'] = partition['user_id'].astype(str)
+    if filters:
+        partition = filter_records(partition, **filters)
+    return partition, partition['date'].min(), partition['date'].max()
+
+
+def read_partitions(file_paths, workers=None, filters=None):
+    """
+    Read the input files in parallel and append them into one SFrame.
+    Return the SFrame and its first and last date.
+    """
+    if len(file_paths) == 1:
+        return read_partition(file_paths[0], filters)
+    pool = ThreadPool(workers or min(len(file_paths), cpu_count()))
+    try:
+        partitions = pool.map(lambda file_path: read_partition(file_path, filters), file_paths)
+    finally:
+        pool.close()
+    columns = [column for column in partitions[0][0].column_names()
+               if all(column in partition.column_names() for partition, _, _ in partitions)]
+    # the files may have different types of locations
+    cast_location = len(set(partition['location'].dtype() for partition, _, _ in partitions)) > 1
+    user_daily_loc_count = None
+    for partition, _, _ in partitions:
+        partition = partition.select_columns(columns)
+        if cast_location:
+            partition['location'] = partition['location'].astype(str)
+        if user_daily_loc_count is None:
+            user_daily_loc_count = partition
+        else:
+            user_daily_loc_count = user_daily_loc_count.append(partition)
+    # files without records left after the filters have no dates
+    first_date = min([first for _, first, _ in partitions if first is not None] or [None])
+    last_date = max(last for _, _, last in partitions)
+    return user_daily_loc_count, first_date, last_date
 
 
-def read_csv(file_path):
-    user_daily_loc_count = gl.SFrame.read_csv(file_path, verbose=False)
-    user_daily_loc_count['user_id'] = user_daily_loc_count['user_id'].astype(str)
+def read_csv(file_path, location_levels=None, base_level='base', workers=None,
+             users=None, sample=None, start_date=None, end_date=None, locations=None):
+    """
+    Read the daily locations of users.
+
+    file_path can be a file, a directory of .csv files, a glob pattern
+    (e.g. 'data/2018*.csv') or a list of them. Several files are read in
+    parallel by workers threads and merged into one TrajRecord.
+
+    With location_levels, e.g. [('province', {district: province, ...})],
+    the records are also rolled up to the upper levels of the locations,
+    and find_migrants detects the migrations of every level in one run.
+    The trajectories and the results then have a 'level' column
+    (base_level for the input locations). See roll_up_locations.
+
+    The records can be filtered as each file is read, before they are
+    aggregated: users keeps the given user ids, sample keeps a fraction
+    (0 to 1) of the users chosen by user_hash, start_date and end_date
+    (YYYYMMDD) keep a date window, and locations keeps the given locations
+    (of the input level). The day index starts at start_date and ends at
+    end_date if they are given, else at the first and last date of the
+    records kept.
+    """
+    file_paths = expand_paths(file_path)
+    filters = dict((name, value) for name, value in
+                   [('users', users), ('sample', sample), ('start_date', start_date),
+                    ('end_date', end_date), ('locations', locations)] if value is not None)
+    user_daily_loc_count, first_date, last_date = read_partitions(file_paths, workers, filters)
+    assert len(user_daily_loc_count) > 0, "no records left after the filters " + str(filters)
+    fingerprint_options = {'location_levels': location_levels, 'base_level': base_level}
+    if filters:
+        fingerprint_options['filters'] = filter_fingerprint(filters)
+    return build_traj(user_daily_loc_count, first_date, last_date,
+                      file_fingerprint(file_paths, **fingerprint_options),
+                      location_levels, base_level, start_date, end_date)
+
+
+def filter_fingerprint(filters):
+    """
+    The filters of filter_records in a stable form for file_fingerprint.
+    """
+    return dict((name, sorted(value) if name in ['users', 'locations'] else value)
+                for name, value in filters.items())
+
+
+def build_traj(user_daily_loc_count, first_date, last_date, fingerprint,
+               location_levels=None, base_level='base', start_date=None, end_date=None):
+    """
+    TrajRecord of the daily records (SFrame of 'user_id', 'date', 'location')
+    from first_date to last_date; see read_csv for the other arguments.
+    """
     # Prepare migration record
     # Assign day index to each date
-    start_date_ori = str(user_daily_loc_count['date'].min())
-    end_date_ori = str(user_daily_loc_count['date'].max())
-    # MM/DD/YYYY
-    start_date = '/'.join([start_date_ori[4:6], start_date_ori[6:],
-                           start_date_ori[:4]])
-    end_date = '/'.join([end_date_ori[4:6], end_date_ori[6:], end_date_ori[:4]])
-    all_date = pd.date_range(start=start_date, end=end_date)
-    all_date_new = [int(str(x)[:4] + str(x)[5:7] + str(x)[8:10])
-                    for x in all_date]
+    start_day = date_to_day(first_date if start_date is None else start_date)
+    end_day = date_to_day(last_date if end_date is None else end_date)
+    all_date_new = [day_to_date(day) for day in range(start_day, end_day + 1)]
     date2index = dict(zip(all_date_new, range(len(all_date_new))))
     index2date = dict(zip(range(len(all_date_new)), all_date_new))
 
-    end_date_long_ori = str(pd.Timestamp(end_date)+pd.Timedelta('200 day'))
-    all_date_long = pd.date_range(start=start_date, end=end_date_long_ori)
-    all_date_long_new = [int(str(x)[:4] + str(x)[5:7] + str(x)[8:10])
-                         for x in all_date_long]
+    all_date_long_new = [day_to_date(day) for day in range(start_day, end_day + 200 + 1)]
     date_num_long = gl.SFrame({'date': all_date_long_new,
                                'date_num': range(len(all_date_long_new))})
 
@@ -33,25 +191,145 @@ def read_csv(file_path):
     migration_df['date_num'] = migration_df.apply(
         lambda x: date2index[x['date']]
     )
+    user_columns = ['user_id']
+    if location_levels:
+        migration_df = roll_up_locations(migration_df, location_levels, base_level)
+        user_columns = ['user_id', 'level']
+    # Run the pipeline on dense int codes of users and locations
+    user_ids = Dictionary(migration_df['user_id'])
+    locations = Dictionary(migration_df['location'])
+    migration_df = user_ids.encode(migration_df, 'user_id')
+    migration_df = locations.encode(migration_df, 'location')
     # Aggregate user daily records
     user_loc_date_agg = migration_df.groupby(
-        ['user_id', 'location'],
-        {'all_date': gl.aggregate.CONCAT('date_num')}
+        user_columns + ['location'],
+        {'all_date': gl.aggregate.CONCAT('date_num'),
+         'num_record': gl.aggregate.COUNT(),
+         'first_day': gl.aggregate.MIN('date_num'),
+         'last_day': gl.aggregate.MAX('date_num')}
     )
     user_loc_agg = user_loc_date_agg.groupby(
-        ['user_id'],
-        {'all_record': gl.aggregate.CONCAT('location', 'all_date')}
+        user_columns,
+        {'all_record': gl.aggregate.CONCAT('location', 'all_date'),
+         'num_location': gl.aggregate.COUNT(),
+         'num_record': gl.aggregate.SUM('num_record'),
+         'first_day': gl.aggregate.MIN('first_day'),
+         'last_day': gl.aggregate.MAX('last_day')}
     )
-    traj = TrajRecord(user_loc_agg, migration_df, index2date, date_num_long)
+    # Cost of each user for scheduling (see schedule.py)
+    user_loc_agg['cost'] = user_cost(user_loc_agg['num_record'], user_loc_agg['num_location'],
+                                     user_loc_agg['last_day'] - user_loc_agg['first_day'] + 1)
+    user_loc_agg = user_loc_agg.select_columns(user_columns + ['all_record', 'cost'])
+    traj = TrajRecord(user_loc_agg, migration_df, index2date, date_num_long,
+                      fingerprint=fingerprint, user_ids=user_ids, locations=locations)
     return traj
 
 
-def to_csv(result, result_path='result', file_name='migration_event.csv'):
+def reduce_hourly_chunk(chunk, tower_ids, tower_locations, tower_column='cell_tower',
+                        night=False):
+    """
+    Unique daily (user_id, date, location) of a chunk of hourly records
+    (pandas DataFrame), with each tower of tower_ids (pandas Index) mapped to
+    its location in tower_locations. Records at other towers are dropped.
+    Return the daily records and the number of records dropped.
+    """
+    import pandas as pd
+    if night:
+        chunk = chunk[chunk['hour'].isin(NIGHT_HOURS)]
+    tower_index = tower_ids.get_indexer(chunk[tower_column].values)
+    known = tower_index >= 0
+    date = chunk['date'].values[known].astype(np.int64)
+    if night:
+        date = shift_night_date(date, chunk['hour'].values[known])
+    daily = pd.DataFrame({'user_id': chunk['user_id'].values[known],
+                          'date': date,
+                          'location': tower_locations[tower_index[known]]})
+    return daily.drop_duplicates(), int((~known).sum())
+
+
+def read_hourly(file_path, tower_district, night=False, tower_column='cell_tower',
+                memory_limit='1GB', location_levels=None, base_level='base',
+                users=None, sample=None, start_date=None, end_date=None, locations=None):
+    """
+    Read hourly tower records as the daily locations of users, without
+    writing the daily records to a file first.
+
+    file_path (see read_csv) holds csv files with the columns user_id, date
+    (YYYYMMDD), hour and tower_column. They are read in chunks of about
+    memory_limit, and each chunk is reduced to its unique (user_id, date,
+    location), with the towers mapped to their districts by tower_district
+    (see frequency_based.read_tower_district: 'SITEID' -> 'Dist_ID'), so
+    only the daily records are kept. With night, only the records at night
+    (frequency_based.NIGHT_HOURS) are used, and those up to 8am belong to
+    the date of the evening before (see date_utils.shift_night_date).
+
+    The other arguments are those of read_csv; the filters apply to the
+    daily records.
+    """
+    import pandas as pd
+    file_paths = expand_paths(file_path)
+    tower_ids = pd.Index(np.asarray(tower_district['SITEID']))
+    tower_locations = np.asarray(tower_district['Dist_ID'])
+    assert tower_ids.is_unique, "a tower has several districts in tower_district"
+    filters = dict((name, value) for name, value in
+                   [('users', users), ('sample', sample), ('start_date', start_date),
+                    ('end_date', end_date), ('locations', locations)] if value is not None)
+    chunk_records = max(1, parse_size(memory_limit) // HOURLY_RECORD_BYTES)
+    user_daily_loc = None
+    num_hourly = 0
+    num_unknown = 0
+    for one_path in file_paths:
+        for chunk in pd.read_csv(one_path, usecols=['user_id', 'date', 'hour', tower_column],
+                                 dtype={'user_id': str}, chunksize=chunk_records):
+            daily, unknown = reduce_hourly_chunk(chunk, tower_ids, tower_locations,
+                                                 tower_column, night)
+            num_hourly += len(chunk)
+            num_unknown += unknown
+            if len(daily) == 0:
+                continue
+            daily = gl.SFrame(daily).select_columns(['user_id', 'date', 'location'])
+            if filters:
+                daily = filter_records(daily, **filters)
+            user_daily_loc = daily if user_daily_loc is None else user_daily_loc.append(daily)
+    assert user_daily_loc is not None and len(user_daily_loc) > 0, \
+        "no daily records in %s after the filters %s" % (file_path, filters)
+    # a user may be at a location on the same date in several chunks
+    user_daily_loc = user_daily_loc.unique()
+    print('Reduced %d hourly records to %d daily records (%d at unknown towers)' % (
+        num_hourly, len(user_daily_loc), num_unknown))
+
+    towers = sorted(zip(tower_ids.tolist(), tower_locations.tolist()))
+    fingerprint_options = {'reader': 'hourly', 'tower_column': tower_column, 'night': night,
+                           'towers': hashlib.md5(json.dumps(towers, default=str)).hexdigest(),
+                           'location_levels': location_levels, 'base_level': base_level}
+    if filters:
+        fingerprint_options['filters'] = filter_fingerprint(filters)
+    return build_traj(user_daily_loc, user_daily_loc['date'].min(), user_daily_loc['date'].max(),
+                      file_fingerprint(file_paths, **fingerprint_options),
+                      location_levels, base_level, start_date, end_date)
+
+
+def to_csv(result, result_path='result', file_name='migration_event.csv', traj=None):
+    """
+    Save the migration events found by traj.find_migrants, with the original
+    user ids and locations. A result of find_migrants(decode=False) has the
+    codes of the users and locations, and needs traj to decode them
+    (see TrajRecord.decode).
+    """
+    if traj is not None:
+        result = traj.decode(result)
+    elif 'user_code' not in result.column_names():
+        raise ValueError("the result of find_migrants(decode=False) has the codes of the users "
+                         "and locations: give traj=traj to save their values")
     if not os.path.isdir(result_path):
         os.makedirs(result_path)
     save_file = os.path.join(result_path, file_name)
+    user_columns = ['user_id']
+    if 'level' in result.column_names():
+        user_columns = ['user_id', 'level']
     result.select_columns(
-        ['user_id', 'home', 'destination', 'migration_date',
+        user_columns +
+        ['home', 'destination', 'migration_date',
          'uncertainty', 'num_error_day',
          'home_start', 'home_end',
          'destination_start', 'destination_end',
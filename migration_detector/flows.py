@@ -0,0 +1,164 @@
+import graphlab as gl
+import json
+import os
+import numpy as np
+from .traj_utils import MIGRATION_EVENT_DTYPE
+
+PERIOD_DIVISOR = {'day': 1, 'month': 100, 'year': 10000}
+WEIGHTS = [None, 'uncertainty', 'num_error_day']
+METADATA_FILE = 'flow_matrix.json'
+
+
+class FlowMatrix():
+    """
+    Sparse origin-destination flows of migrations by period, accumulated from
+    the results of find_migrants.
+
+    Flows of several shards (e.g. the input files of different workers) can be
+    accumulated separately, saved, and merged.
+    """
+    def __init__(self, period='month', weight=None):
+        """
+        Attributes
+        ----------
+        period : str
+            'day', 'month' or 'year' of the migration date
+            (YYYYMMDD, YYYYMM or YYYY in the flows)
+        weight : str
+            None: each migration counts 1;
+            'uncertainty' or 'num_error_day': each migration counts
+            1 / (1 + max(value of this column, 0)), to down-weight uncertain
+            migration dates (uncertainty is negative when the segments
+            overlap, see min_overlap_part_len, and these migrations count 1)
+        flows : dict
+            {(level, period, home, destination): [count, weight]}, level is None
+            if the locations have one level
+        """
+        assert period in PERIOD_DIVISOR, "period must be one of " + str(sorted(PERIOD_DIVISOR))
+        assert weight in WEIGHTS, "weight must be one of " + str(WEIGHTS)
+        self.period = period
+        self.weight = weight
+        self.flows = {}
+
+    def add(self, result, traj=None):
+        """
+        Add the migrations in result (returned by find_migrants).
+        Give traj to decode the codes of the locations, so that flows of
+        different inputs can be merged.
+        """
+        if result is None or len(result) == 0:
+            return
+        keys = ['period', 'home', 'destination']
+        if 'level' in result.column_names():
+            keys = ['level'] + keys
+        sf = result.select_columns([key for key in keys if key != 'period'])
+        sf['period'] = result['migration_date'] // PERIOD_DIVISOR[self.period]
+        aggregates = {'count': gl.aggregate.COUNT()}
+        if self.weight is not None:
+            sf['weight'] = 1.0 / (result[self.weight].clip_lower(0) + 1)
+            aggregates['weight'] = gl.aggregate.SUM('weight')
+        flow_sf = sf.groupby(keys, aggregates)
+        if traj is not None:
+            flow_sf = traj.decode(flow_sf)
+        self._add_flows(dict(
+            ((row.get('level'), row['period'], row['home'], row['destination']),
+             [row['count'], row['weight'] if self.weight is not None else row['count']])
+            for row in flow_sf))
+
+    def add_events(self, user_long_seg, index2date, traj=None):
+        """
+        Add the migrations of the 'migration_event' column of find_migrants
+        (flat lists of MIGRATION_EVENT_DTYPE records of each user), before
+        they are expanded to one row per migration. index2date gives the
+        dates of the migration days; see add for traj.
+        """
+        date_of_day = np.array([index2date[day] for day in range(len(index2date))])
+        columns = ['migration_event']
+        if 'level' in user_long_seg.column_names():
+            columns.append('level')
+        flows = {}
+        for row in user_long_seg.select_columns(columns):
+            if not row['migration_event']:
+                continue
+            events = np.array(row['migration_event'], dtype=np.int32).view(MIGRATION_EVENT_DTYPE)
+            periods = date_of_day[events['migration_day']] // PERIOD_DIVISOR[self.period]
+            if self.weight is None:
+                weights = np.ones(len(events))
+            else:
+                # uncertainty is seg_diff - 1 in the result
+                values = (events['seg_diff'] - 1 if self.weight == 'uncertainty'
+                          else events['num_error_day'])
+                weights = 1.0 / (np.maximum(values, 0) + 1)
+            for period, home, destination, weight in zip(periods, events['home'],
+                                                         events['destination'], weights):
+                key = (row.get('level'), int(period), int(home), int(destination))
+                flow = flows.setdefault(key, [0, 0.0])
+                flow[0] += 1
+                flow[1] += float(weight)
+        if traj is not None and flows:
+            keys = list(flows)
+            flow_sf = traj.decode(gl.SFrame({'key': range(len(keys)),
+                                             'home': [key[2] for key in keys],
+                                             'destination': [key[3] for key in keys]}))
+            flows = dict(((keys[row['key']][0], keys[row['key']][1],
+                           row['home'], row['destination']), flows[keys[row['key']]])
+                         for row in flow_sf)
+        self._add_flows(flows)
+
+    def _add_flows(self, flows):
+        for key, (count, weight) in flows.items():
+            flow = self.flows.setdefault(key, [0, 0.0])
+            flow[0] += count
+            flow[1] += weight
+
+    def merge(self, other):
+        """
+        Add the flows of another FlowMatrix with the same period and weight.
+        """
+        assert (other.period, other.weight) == (self.period, self.weight), \
+            "can only merge flows with the same period and weight"
+        self._add_flows(other.flows)
+        return self
+
+    def to_sframe(self):
+        """
+        Flows as a table: level (if any), period, home, destination, count, weight.
+        """
+        keys = sorted(self.flows)
+        sf = gl.SFrame({
+            'level': [key[0] for key in keys],
+            'period': [key[1] for key in keys],
+            'home': [key[2] for key in keys],
+            'destination': [key[3] for key in keys],
+            'count': [self.flows[key][0] for key in keys],
+            'weight': [self.flows[key][1] for key in keys],
+        })
+        columns = ['period', 'home', 'destination', 'count', 'weight']
+        if any(key[0] is not None for key in keys):
+            columns = ['level'] + columns
+        return sf.select_columns(columns)
+
+    def to_csv(self, file_path):
+        self.to_sframe().export_csv(file_path)
+
+    def save(self, path):
+        """
+        Save the flows to a local directory, to be loaded and merged later.
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.to_sframe().save(os.path.join(path, 'flows'))
+        with open(os.path.join(path, METADATA_FILE), 'w') as f:
+            json.dump({'period': self.period, 'weight': self.weight}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        flow_matrix = cls(str(metadata['period']),
+                          metadata['weight'] and str(metadata['weight']))
+        sf = gl.load_sframe(os.path.join(path, 'flows'))
+        for row in sf:
+            key = (row.get('level'), row['period'], row['home'], row['destination'])
+            flow_matrix.flows[key] = [row['count'], row['weight']]
+        return flow_matrix
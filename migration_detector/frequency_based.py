@@ -0,0 +1,527 @@
+# coding: utf-8
+
+from __future__ import division
+import graphlab as gl
+import numpy as np
+from .date_utils import shift_night_date, month_index, month_length
+
+# The input file1 [user_hourly_tower_dist] should contain the following columns: 
+# user_id, date(yyyymmdd, int), hour(int), cell_tower_id, district_id, nearby_tower_list(list)
+# If input file1 [user_hourly_tower_dist] does not contain the 'district_id' or 'nearby_tower' column, 
+# could use add_nearby_tower() at the end to find the nearby 1km towers of each record.
+# The input file2 [tower_district] should contain cell_tower_id and district_id 
+# to provide a reference for (cell_tower_id -> district_id)
+
+# hours at night (7pm to 9am) for method 3 and method 5
+NIGHT_HOURS = list(range(0, 10)) + list(range(19, 25))
+
+
+def read_user_hourly_tower_dist(file_path):
+    """
+    Read the pickled pandas dataframe of users' hourly tower and district location.
+    """
+    import pandas as pd
+    return gl.SFrame(pd.read_pickle(file_path))
+
+
+def read_tower_district(file_path):
+    """
+    Read the csv file of towers: 'Dist_ID', 'SITEID', 'LONG', 'LAT'.
+    """
+    return gl.SFrame.read_csv(file_path, verbose=False)
+
+
+def get_start_year(x):
+    """
+    The year of the first date in x, from which month_idx is counted.
+    """
+    return x['date'].min() // 10000
+
+
+def add_month_idx(x, start_year=None):
+    """
+    Add the column of month index to x, counted from January of start_year (= 1).
+    """
+    if start_year is None:
+        start_year = get_start_year(x)
+    x['month_idx'] = month_index(x['date'], start_year)
+    return x
+
+
+def find_migration_idx(user_id, month_idx, home, num_months_before=3, num_months_after=3):
+    """
+    Find migrations in the monthly home locations of all users at once.
+
+    user_id, month_idx and home are numpy arrays with one row for each user and month,
+    sorted by (user_id, month_idx). A user migrated in month m if the home location is the same
+    for num_months_before consecutive months ending in m, and then is the same destination
+    (different from home) for num_months_after consecutive months starting from m + 1.
+    Return the row index of each migration month m; the destination is in the next row.
+    """
+    if len(home) < 2:
+        return np.array([], dtype=int)
+    # compare each month with the next month of the same user
+    next_month = (user_id[1:] == user_id[:-1]) & (month_idx[1:] == month_idx[:-1] + 1)
+    same_home = next_month & (home[1:] == home[:-1])
+    is_migration = next_month & (home[1:] != home[:-1])
+    for shift in range(1, num_months_before):
+        same_home_before = np.zeros(len(same_home), dtype=bool)
+        same_home_before[shift:] = same_home[:-shift]
+        is_migration &= same_home_before
+    for shift in range(1, num_months_after):
+        same_home_after = np.zeros(len(same_home), dtype=bool)
+        same_home_after[:-shift] = same_home[shift:]
+        is_migration &= same_home_after
+    return np.where(is_migration)[0]
+
+
+def find_migration(x, month_column, home_column, num_months_before=3, num_months_after=3):
+    """
+    x is a SFrame of monthly home location for each user, with the columns
+    ['user_id', month_column, home_column] and one row for each user and month.
+    Return a SFrame of migration, with the columns ['user_id', 'month_idx', 'home', 'destination'],
+    where 'month_idx' is the last month at home.
+    """
+    monthly_home = x.select_columns(['user_id', month_column, home_column]).sort(['user_id', month_column])
+    user_id = monthly_home['user_id'].to_numpy()
+    month_idx = monthly_home[month_column].to_numpy()
+    home = monthly_home[home_column].to_numpy()
+    mig_idx = find_migration_idx(user_id, month_idx, home, num_months_before, num_months_after)
+    freq_stack = gl.SFrame({'user_id': user_id[mig_idx],
+                            'month_idx': month_idx[mig_idx],
+                            'home': home[mig_idx].astype(int),
+                            'destination': home[mig_idx + 1].astype(int)})
+    return freq_stack.select_columns(['user_id','month_idx','home','destination'])
+
+
+## Method 1: 
+# The majority of both outgoing and incoming calls and texts were made (amount of activities criterion)
+
+def find_top1_loc_by_count(x):
+    """
+    x should be a dictionary listing the counts for each location appeared each month, 
+    as {location_ID: location_monthly_count}
+    """
+    loc_dict = x
+    top1_count = max(loc_dict.values())
+    top1_loc = [k for k,v in loc_dict.iteritems() if v == top1_count]
+    top1_loc = top1_loc[0]
+    return top1_loc
+
+
+def method1_monthly_loc(x, num_months_before=3, num_months_after=3):
+    """
+    Infer monthly location as where the majority of both outgoing and incoming calls and texts were made 
+    (amount of activities criterion)
+    
+    x should be a SFrame showing users' hourly district location, 
+    with a month_idx column indicating the month index for each date.
+    """
+    # using the raw network data(from hourly to daily)
+    sel_user_monthly_m1_2 = (x.groupby(['user_id', 'month_idx', 'Dist_ID'], 
+                           {'monthly_dist_count': gl.aggregate.COUNT('user_id')}))
+    sel_user_monthly_m1_3 = (sel_user_monthly_m1_2.groupby(['user_id', 'month_idx'], 
+                            {'dist_count_night': gl.aggregate.CONCAT('Dist_ID', 'monthly_dist_count')}))
+    sel_user_monthly_m1_3['home_loc'] = (sel_user_monthly_m1_3['dist_count_night']
+                                         .apply(lambda x: find_top1_loc_by_count(x)))
+
+    freq_stack = find_migration(sel_user_monthly_m1_3, 'month_idx', 'home_loc',
+                                num_months_before, num_months_after)
+    
+    return(freq_stack)
+
+
+## Method 2: 
+# The maximum number of distinct days with phone activities – both outgoing and incoming calls and texts – was observed (amount of distinct days criterion)
+
+def method2_monthly_loc(x, num_months_before=3, num_months_after=3):
+    """
+    Infer monthly location as where the maximum number of distinct days with phone activities 
+    – both outgoing and incoming calls and texts – was observed. (amount of distinct days criterion)
+    
+    x should be a SFrame showing users' hourly district location, 
+    with a month_idx column indicating the month index for each date.
+    """
+    sel_user_monthly_m22_1 = (x.groupby(['user_id', 'month_idx', 'Dist_ID'], 
+                       {'distinct_date_count': gl.aggregate.COUNT_DISTINCT('date')}))
+    sel_user_monthly_m22_2 = (sel_user_monthly_m22_1.groupby(['user_id', 'month_idx'], 
+                            {'distinct_date_count_list': gl.aggregate.CONCAT('Dist_ID', 'distinct_date_count')}))
+    sel_user_monthly_m22_2['home_loc'] = (sel_user_monthly_m22_2['distinct_date_count_list']
+                                         .apply(lambda x: find_top1_loc_by_count(x)))
+
+    freq_stack = find_migration(sel_user_monthly_m22_2, 'month_idx', 'home_loc',
+                                num_months_before, num_months_after)
+    
+    return(freq_stack)
+
+
+## Method 2 + propDays
+
+def find_top1_dist_over_prop_by_count(x, prop):
+    """
+    x is each row of user_monthly_district_list.
+    column ['monthly_dist_count_list']: {dist_ID: Dist_monthly_count}
+    column ['month_len']: number of days in this month
+    Similar to the segment-based method that, only keep those segments that appear >= prop*len(segment),
+    here we only keep the district that appear >= prop*len(month) as the top1 district. 
+    If none of the districts satisfy this rule, then no top1 district will be returned for this month.
+    """
+    dist_dict = x['distinct_date_count_list']
+    month_len = x['month_len']
+    top1_count = max(dist_dict.values())
+    if top1_count >= prop*month_len:
+        top1_dist = [k for k,v in dist_dict.iteritems() if v == top1_count]
+        top1_dist = top1_dist[0]
+    else:
+        top1_dist = None
+    return top1_dist
+
+
+def method2_monthly_loc_over_prop(x, prop, start_year=None, num_months_before=3, num_months_after=3):
+    """
+    Based on method2, add a rule that the user must apppear at the home location over (prop * num of days in that month).
+    start_year is the year from which month_idx is counted, the first year in x by default.
+    """
+    if start_year is None:
+        start_year = get_start_year(x)
+    sel_user_monthly_m22_1 = (x.groupby(['user_id', 'month_idx', 'Dist_ID'], 
+                       {'distinct_date_count': gl.aggregate.COUNT_DISTINCT('date')}))
+    sel_user_monthly_m22_2 = (sel_user_monthly_m22_1.groupby(['user_id', 'month_idx'], 
+                        {'distinct_date_count_list': gl.aggregate.CONCAT('Dist_ID', 'distinct_date_count')}))
+    sel_user_monthly_m22_2['month_len'] = month_length(sel_user_monthly_m22_2['month_idx'], start_year)
+    sel_user_monthly_m22_2['home_loc_prop'] = (sel_user_monthly_m22_2
+                                     .apply(lambda x: find_top1_dist_over_prop_by_count(x, prop)))
+    # drop those monthly records without monthly district(over prop)
+    sel_user_monthly_m22_3 = sel_user_monthly_m22_2.dropna('home_loc_prop')
+    freq_stack = find_migration(sel_user_monthly_m22_3, 'month_idx', 'home_loc_prop',
+                                num_months_before, num_months_after)
+    
+    return(freq_stack)
+
+
+## Method 3:
+# Most phone activities were recorded during 7 p.m. and 9 a.m. (time constraints criterion)
+
+def method3_monthly_loc(x, num_months_before=3, num_months_after=3):
+    """
+    Infer monthly location as where most phone activities were recorded during 7 p.m. and 9 a.m. 
+    (time constraints criterion)
+    
+    x should be a SFrame showing users' hourly district location at night(7pm to 9am), 
+    with a month_idx column indicating the month index for each date.
+    """
+    sel_user_monthly_m3 = (x.groupby(['user_id', 'month_idx', 'Dist_ID'], 
+                       {'monthly_dist_count_night': gl.aggregate.COUNT('user_id')}))
+    sel_user_monthly_m3_2 = (sel_user_monthly_m3.groupby(['user_id', 'month_idx'], 
+                        {'dist_count_night_list': gl.aggregate.CONCAT('Dist_ID', 'monthly_dist_count_night')}))
+    
+    sel_user_monthly_m3_2['home_loc'] = (sel_user_monthly_m3_2['dist_count_night_list']
+                                     .apply(lambda x: find_top1_loc_by_count(x)))
+    freq_stack = find_migration(sel_user_monthly_m3_2, 'month_idx', 'home_loc',
+                                num_months_before, num_months_after)
+    
+    return(freq_stack)
+
+
+## Method 4:
+# Most phone activities were recorded, implementing a spatial perimeter of 1,000 meters around a cell tower that aggregates all activities within (space constraints criterion) 
+
+def tower_adjacency(x):
+    """
+    Build the tower adjacency (I + A) as a sparse edge list with the columns
+    ['cell_tower', 'nearby_cell_tower'], where A links each tower to the towers
+    in its 'nearby_tower' list and I adds a self loop for every tower.
+
+    x should be a SFrame with the columns 'cell_tower' and 'nearby_tower'.
+    """
+    tower_nearby = x.groupby(['cell_tower'],
+                             {'nearby_tower': gl.aggregate.SELECT_ONE('nearby_tower')})
+    nearby_edge = (tower_nearby.stack('nearby_tower', new_column_name='nearby_cell_tower')
+                   .dropna('nearby_cell_tower'))
+    nearby_edge['nearby_cell_tower'] = nearby_edge['nearby_cell_tower'].apply(lambda x: int(x))
+    self_edge = tower_nearby.select_columns(['cell_tower'])
+    self_edge['nearby_cell_tower'] = self_edge['cell_tower']
+    return self_edge.append(nearby_edge)
+
+
+def tower_count_with_nearby(x, count_column):
+    """
+    Count the activities of each user in each month at every tower, where an
+    activity at a tower also counts for all the towers nearby.
+
+    The hourly records are first aggregated into per-(user_id, month_idx, cell_tower)
+    counts, which are then multiplied by the sparse tower adjacency (I + A)
+    through a join on the edge list. The result is the same as stacking the
+    'nearby_tower' list onto every hourly record, but the hourly table is never
+    exploded by the number of nearby towers.
+
+    x should be a SFrame showing users' hourly tower location,
+    with a month_idx column indicating the month index for each date.
+    Return a SFrame with the columns ['user_id', 'month_idx', 'cell_tower', count_column].
+    """
+    tower_count = x.groupby(['user_id', 'month_idx', 'cell_tower'],
+                            {'tower_count': gl.aggregate.COUNT('user_id')})
+    tower_count_nearby = (tower_count.join(tower_adjacency(x), on='cell_tower', how='inner')
+                          .groupby(['user_id', 'month_idx', 'nearby_cell_tower'],
+                                   {count_column: gl.aggregate.SUM('tower_count')}))
+    tower_count_nearby.rename({'nearby_cell_tower': 'cell_tower'})
+    return tower_count_nearby
+
+
+def method4_monthly_loc(x, tower_district, num_months_before=3, num_months_after=3):
+    """
+    Infer monthly location as where most phone activities were recorded, 
+    implementing a spatial perimeter of 1,000 meters around a cell tower that aggregates all activities within. 
+    (space constraints criterion)
+    
+    x should be a SFrame showing users' hourly tower location, 
+    with a month_idx column indicating the month index for each date.
+    tower_district should be a SFrame to map the tower ('SITEID') to the district ('Dist_ID').
+    """
+    sel_user_monthly_m4 = tower_count_with_nearby(x, 'monthly_tower_count')
+    sel_user_monthly_m4_2 = (sel_user_monthly_m4.groupby(['user_id', 'month_idx'], 
+                        {'monthly_tower_count_list': gl.aggregate.CONCAT('cell_tower', 'monthly_tower_count')}))
+    sel_user_monthly_m4_2['home_tower'] = (sel_user_monthly_m4_2['monthly_tower_count_list']
+                                     .apply(lambda x: find_top1_loc_by_count(x)))
+    
+    sel_user_monthly_m4_3 = (sel_user_monthly_m4_2.join(tower_district.select_columns(['Dist_ID','SITEID']), 
+                                                    on = {'home_tower':'SITEID'}, how = 'inner'))
+    sel_user_monthly_m4_3.rename({'Dist_ID':'home_loc'})
+    freq_stack = find_migration(sel_user_monthly_m4_3, 'month_idx', 'home_loc',
+                                num_months_before, num_months_after)
+    
+    return(freq_stack)
+
+
+## Method 5:
+# The combination of 3) and 4), thus most phone activities recorded during 7 p.m. and 9 a.m. and implementing a spatial perimeter of 1,000 meter (time constraints and space constraint criterion)
+
+def method5_monthly_loc(x, tower_district, num_months_before=3, num_months_after=3):
+    """
+    Infer monthly location as where most phone activities were recorded, 
+    implementing a spatial perimeter of 1,000 meters around a cell tower that aggregates all activities within. 
+    (space constraints criterion)
+    
+    x should be a SFrame showing users' hourly tower location at night(7pm to 9am), 
+    with a month_idx column indicating the month index for each date.
+    tower_district should be a SFrame to map the tower ('SITEID') to the district ('Dist_ID').
+    """
+    sel_user_monthly_m5 = tower_count_with_nearby(x, 'monthly_tower_count_night')
+    sel_user_monthly_m5_2 = (sel_user_monthly_m5.groupby(['user_id', 'month_idx'], 
+                            {'monthly_tower_count_night_list': gl.aggregate.CONCAT('cell_tower', 'monthly_tower_count_night')}))
+    sel_user_monthly_m5_2['home_tower'] = (sel_user_monthly_m5_2['monthly_tower_count_night_list']
+                                         .apply(lambda x: find_top1_loc_by_count(x)))
+
+    sel_user_monthly_m5_3 = (sel_user_monthly_m5_2.join(tower_district.select_columns(['Dist_ID','SITEID']), 
+                                                    on = {'home_tower':'SITEID'}, how = 'inner'))
+
+    sel_user_monthly_m5_3.rename({'Dist_ID':'home_loc'})
+    freq_stack = find_migration(sel_user_monthly_m5_3, 'month_idx', 'home_loc',
+                                num_months_before, num_months_after)
+    
+    return(freq_stack)
+
+## Method 6:
+# Identifies locations where the individual spends the most time. First identifies the hourly modal location by computing the most frequently visited district in every hour of the entire dataset, then aggregates hourly modal locations to find the daily modal location, and finally identifies the monthly modal location by taking the mode over the daily modal locations.
+
+def find_top1_dist_lexicographic(x, group_columns, count_columns, result_column):
+    """
+    Find the top1 district of each group by the lexicographic argmax over count_columns.
+    The first column in count_columns is the modal count; each following column is
+    only used to break the ties left by the columns before it.
+    If the tie is not resolved by the last column, no top1 district is returned for this group.
+
+    x should be a SFrame with one row per (group, Dist_ID) that contains all the count_columns.
+    Return a SFrame with the columns group_columns + [result_column].
+    """
+    top1_candidate = x
+    for count_column in count_columns:
+        top1_count = top1_candidate.groupby(group_columns,
+                                            {'top1_count': gl.aggregate.MAX(count_column)})
+        top1_candidate = top1_candidate.join(top1_count, on=group_columns, how='inner')
+        top1_candidate = top1_candidate[top1_candidate[count_column] == top1_candidate['top1_count']]
+        top1_candidate = top1_candidate.remove_column('top1_count')
+    top1_dist = top1_candidate.groupby(group_columns,
+                                       {'top1_dist_num': gl.aggregate.COUNT('Dist_ID'),
+                                        result_column: gl.aggregate.SELECT_ONE('Dist_ID')})
+    top1_dist = top1_dist[top1_dist['top1_dist_num'] == 1]
+    return top1_dist.select_columns(group_columns + [result_column])
+
+def method6_monthly_loc(x, start_year=None, num_months_before=3, num_months_after=3):
+    """
+    Infer monthly location where the individual spends the most time. 
+    First identifies the hourly modal location by computing the most frequently visited district in every hour of the entire dataset, 
+    then aggregates hourly modal locations to find the daily modal location, 
+    and finally identifies the monthly modal location by taking the mode over the daily modal locations.
+    
+    x should be a SFrame showing users' hourly tower/district location,
+    with a month_idx column indicating the month index for each date.
+    start_year is the year from which month_idx is counted, the first year in x by default.
+    """
+    if start_year is None:
+        start_year = get_start_year(x)
+    # method 6: h >= 18 or h <=7:
+    sel_user_hourly_dist_m6 = x.filter_by(list(range(0,8))+list(range(18,25)),'hour')
+    # assign the records before 9am to the previous day
+    sel_user_hourly_dist_m6['new_date'] = shift_night_date(sel_user_hourly_dist_m6['date'],
+                                                           sel_user_hourly_dist_m6['hour'])
+    sel_user_hourly_dist_m6['new_month_idx'] = month_index(sel_user_hourly_dist_m6['new_date'], start_year)
+    
+    # get all daily district not based on hour. this is used to choose hour tie
+    daily_dist_sf = sel_user_hourly_dist_m6.groupby(['user_id','new_date','Dist_ID'],
+                                 {'daily_dist_count': gl.aggregate.COUNT('Dist_ID')})
+    
+    # get all monthly district not based on day.
+    monthly_dist_sf = sel_user_hourly_dist_m6.groupby(['user_id','new_month_idx','Dist_ID'],
+                                 {'monthly_dist_count': gl.aggregate.COUNT('Dist_ID')})
+
+    # step 2: prepare hourly data to calculate hourly modal district
+    hourly_dist_sf = sel_user_hourly_dist_m6.groupby(['user_id','new_month_idx','new_date','hour','Dist_ID'],
+                                 {'hourly_dist_count': gl.aggregate.COUNT('Dist_ID')})
+    hourly_dist_sf2 = (hourly_dist_sf.join(daily_dist_sf, on=['user_id','new_date','Dist_ID'], how='inner')
+                       .join(monthly_dist_sf, on=['user_id','new_month_idx','Dist_ID'], how='inner'))
+    # find one dist hour: break hourly ties by daily all modal, then by monthly all modal
+    hourly_top1_dist_sf = find_top1_dist_lexicographic(
+        hourly_dist_sf2, ['user_id','new_month_idx','new_date','hour'],
+        ['hourly_dist_count','daily_dist_count','monthly_dist_count'], 'hourly_top1_dist')
+    
+    # step 3: prepare daily data to calculate daily modal district
+    daily_htop1_dist_sf = (hourly_top1_dist_sf.groupby(['user_id', 'new_month_idx','new_date','hourly_top1_dist'],
+                       {'daily_htop1_dist_count': gl.aggregate.COUNT('hour')}))
+    daily_htop1_dist_sf.rename({'hourly_top1_dist': 'Dist_ID'})
+    daily_htop1_dist_sf2 = (daily_htop1_dist_sf.join(daily_dist_sf, on=['user_id','new_date','Dist_ID'], how='inner')
+                            .join(monthly_dist_sf, on=['user_id','new_month_idx','Dist_ID'], how='inner'))
+    
+    # find one dist daily
+    daily_top1_dist_sf = find_top1_dist_lexicographic(
+        daily_htop1_dist_sf2, ['user_id','new_month_idx','new_date'],
+        ['daily_htop1_dist_count','daily_dist_count','monthly_dist_count'], 'daily_top1_dist')
+    
+    # step 4: prepare daily data to calculate monthly modal district
+    monthly_dtop1_dist_sf = (daily_top1_dist_sf.groupby(['user_id', 'new_month_idx','daily_top1_dist'],
+                           {'monthly_dtop1_dist_count': gl.aggregate.COUNT('new_date')}))
+    monthly_dtop1_dist_sf.rename({'daily_top1_dist': 'Dist_ID'})
+    monthly_dtop1_dist_sf2 = monthly_dtop1_dist_sf.join(monthly_dist_sf, on=['user_id','new_month_idx','Dist_ID'],
+                                                        how='inner')
+    # find one dist monthly
+    monthly_dtop1_dist_sf3 = find_top1_dist_lexicographic(
+        monthly_dtop1_dist_sf2, ['user_id','new_month_idx'],
+        ['monthly_dtop1_dist_count','monthly_dist_count'], 'monthly_top1_dist')
+    
+    # find migration by monthly modal district
+    freq_stack = find_migration(monthly_dtop1_dist_sf3, 'new_month_idx', 'monthly_top1_dist',
+                                num_months_before, num_months_after)
+    
+    return(freq_stack)
+
+
+
+MONTHLY_LOC_METHODS = ['method1', 'method2', 'method2_over_prop', 'method3',
+                       'method4', 'method5', 'method6']
+
+
+def run_methods(user_hourly_tower_dist, tower_district=None, methods=None, prop=0.3,
+                num_months_before=3, num_months_after=3):
+    """
+    Detect migrations with the chosen frequency-based methods.
+
+    Attributes
+    ----------
+    user_hourly_tower_dist : gl.SFrame
+        Users' hourly tower and district location:
+        'user_id', 'date', 'hour', 'cell_tower', 'Dist_ID', 'nearby_tower'
+    tower_district : gl.SFrame
+        Tower to district: 'Dist_ID', 'SITEID'. Only needed by method4 and method5.
+    methods : list
+        Names of the methods to run (see MONTHLY_LOC_METHODS), all methods by default
+    prop : float
+        Proportion of days in a month for method2_over_prop
+    num_months_before : int
+        Number of months to stay at home before a migration
+    num_months_after : int
+        Number of months to stay at destination after a migration
+
+    Return a dict of {method name: SFrame of migrations}.
+    """
+    if methods is None:
+        methods = MONTHLY_LOC_METHODS
+    for method in methods:
+        assert method in MONTHLY_LOC_METHODS, "unknown method " + str(method)
+    if tower_district is None:
+        assert not set(['method4', 'method5']) & set(methods), "method4 and method5 need tower_district"
+    start_year = get_start_year(user_hourly_tower_dist)
+    if 'month_idx' not in user_hourly_tower_dist.column_names():
+        user_hourly_tower_dist = add_month_idx(user_hourly_tower_dist.copy(), start_year)
+    if set(['method3', 'method5']) & set(methods):
+        user_hourly_tower_dist_night = user_hourly_tower_dist.filter_by(NIGHT_HOURS, 'hour')
+    window = {'num_months_before': num_months_before, 'num_months_after': num_months_after}
+    result = {}
+    for method in methods:
+        if method == 'method1':
+            result[method] = method1_monthly_loc(user_hourly_tower_dist, **window)
+        elif method == 'method2':
+            result[method] = method2_monthly_loc(user_hourly_tower_dist, **window)
+        elif method == 'method2_over_prop':
+            result[method] = method2_monthly_loc_over_prop(user_hourly_tower_dist, prop, start_year, **window)
+        elif method == 'method3':
+            result[method] = method3_monthly_loc(user_hourly_tower_dist_night, **window)
+        elif method == 'method4':
+            result[method] = method4_monthly_loc(user_hourly_tower_dist, tower_district, **window)
+        elif method == 'method5':
+            result[method] = method5_monthly_loc(user_hourly_tower_dist_night, tower_district, **window)
+        elif method == 'method6':
+            result[method] = method6_monthly_loc(user_hourly_tower_dist, start_year, **window)
+    return result
+
+
+# If input data1 user_hourly_tower_dist does not contain the 'nearby_tower' column, 
+# could use the following codes to find the nearby 1km tower and add the list to the sframe as a new column.
+# (The radius to find towers nearby could be adjusted.) 
+
+def tower_nearby(x, all_tower, lon, lat, raduis, R=6373.0):
+    """
+    x: each row in tower_district
+    all_tower: array of all the towers
+    lon, lat: arrays of the coordinates of all_tower in radians
+    raduis: km
+    R = 6373.0
+    """
+    
+    dlon = lon - np.radians(x['LONG'])
+    dlat = lat - np.radians(x['LAT'])
+        
+    a = np.sin(dlat / 2)**2 + np.cos(lat) * np.cos(np.radians(x['LAT'])) * np.sin(dlon / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    distance = R * c
+    #distance2 = np.array([geopy.distance.vincenty((coords_1[1],coords_1[0]), (x['LAT'],x['LONG'])).km 
+    #                      for coords_1 in all_coord])
+    
+    nearby_tower = all_tower[np.where(distance<=raduis)]
+    nearby_tower = list(set(nearby_tower) - set([x['SITEID']]))
+    
+    return nearby_tower
+
+
+def find_tower_nearby(tower_district, raduis=1):
+    """
+    Find the towers within raduis km of each tower.
+    Return a SFrame with the columns ['Dist_ID', 'SITEID', 'nearby_tower'].
+    """
+    tower_coord = tower_district.select_columns(['Dist_ID','SITEID','LONG','LAT'])
+    tower_unique = tower_coord.select_columns(['SITEID','LONG','LAT']).groupby(
+        ['SITEID'], {'LONG': gl.aggregate.SELECT_ONE('LONG'), 'LAT': gl.aggregate.SELECT_ONE('LAT')})
+    all_tower = tower_unique['SITEID'].to_numpy()
+    lon = np.radians(tower_unique['LONG'].to_numpy())
+    lat = np.radians(tower_unique['LAT'].to_numpy())
+    tower_coord['nearby_tower'] = tower_coord.apply(lambda x: tower_nearby(x, all_tower, lon, lat, raduis))
+    return tower_coord.select_columns(['Dist_ID','SITEID','nearby_tower'])
+
+
+def add_nearby_tower(user_hourly_tower_dist, tower_district, raduis=1):
+    """
+    From tower to district, add a new column of nearby_tower to users' hourly tower location.
+    """
+    tower_dist_w_nearby = find_tower_nearby(tower_district, raduis)
+    return user_hourly_tower_dist.join(tower_dist_w_nearby.remove_column('Dist_ID'),
+                                       on={'cell_tower':'SITEID'})
@@ -0,0 +1,42 @@
+import graphlab as gl
+
+
+def roll_up_locations(traj, location_levels, base_level='base'):
+    """
+    Add the daily records of each level of a location hierarchy to traj,
+    with a 'level' column, so that find_migrants runs on all the levels at once.
+
+    A user is at a location of an upper level on a day if he/she is at any
+    of its lower-level locations on that day. Locations without a parent
+    are left out of the upper levels.
+
+    Attributes
+    ----------
+    traj : gl.SFrame
+        Daily records: 'user_id', 'date', 'date_num', 'location'
+    location_levels : list
+        [(level, {location: parent}), ...] from the lowest to the highest level.
+        The first mapping is from the input locations, and each of the others
+        is from the locations of the level before.
+    base_level : str
+        Level of the input locations
+    """
+    columns = ['user_id', 'date', 'date_num', 'location']
+    level_traj = traj.select_columns(columns)
+    all_level_traj = [(base_level, level_traj)]
+    for level, parent in location_levels:
+        parent_sf = gl.SFrame({'location': parent.keys(), 'parent': parent.values()})
+        level_traj = level_traj.join(parent_sf, on='location', how='inner')
+        level_traj = level_traj.remove_column('location').rename({'parent': 'location'})
+        level_traj = level_traj.select_columns(columns).unique()
+        all_level_traj.append((level, level_traj))
+
+    # one column can only have one type
+    if len(set(sf['location'].dtype() for _, sf in all_level_traj)) > 1:
+        for _, sf in all_level_traj:
+            sf['location'] = sf['location'].astype(str)
+    result = None
+    for level, sf in all_level_traj:
+        sf['level'] = level
+        result = sf if result is None else result.append(sf)
+    return result
@@ -0,0 +1,130 @@
+# Plotting dependencies are only imported with this module,
+# which is loaded the first time a trajectory or segment is plotted.
+import graphlab as gl
+import pandas as pd
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import matplotlib.patches as patches
+import seaborn as sns
+
+
+def plot_traj_common(traj, user_id, start_day, end_day, date_num_long, locations=None):
+    """
+    Common code for plotting trajectory.
+    (1) any individual's trajecotry;
+    (2) migrants' trajectory + segment + migration date
+
+    Attributes
+    ----------
+    traj : gl.dataframe
+        Trajector of users after aggregation
+    user_id : str
+        User id
+    start_day : int
+        index of start day
+    end_day : int
+        index of end day
+    date_num_long : gl.SFrame
+        Date and num: 'date', 'date_num'
+    locations : Dictionary
+        Codes of the locations in traj, to label the locations with their original values
+    """
+    duration = end_day - start_day + 1
+    start_date = str(date_num_long.filter_by(start_day, 'date_num')['date'][0])
+    end_date = str(date_num_long.filter_by(end_day, 'date_num')['date'][0])
+    month_start = pd.date_range(start=start_date, end=end_date, freq='MS')
+    month_start_2 = [str(d)[:4] + str(d)[5:7] + str(d)[8:10] for d in month_start]
+    month_mid = [str(int(d) + 14) for d in month_start_2]
+
+    month_all_axis = month_start_2 + month_mid
+    month_all_axis.sort()
+    if month_all_axis[-1] > end_date:
+        month_all_axis = month_all_axis[:-1]
+    month_all_axis_trans = [int(d) for d in month_all_axis]
+
+    daily_record = traj.filter_by(user_id, 'user_id').filter_by(
+        range(start_day, end_day + 1), 'date_num'
+    )
+    daily_record['date_count'] = [1] * len(daily_record)
+    appear_loc = list(set(daily_record['location']))
+    appear_loc.sort()
+    date_plot = range(start_day, end_day + 1)
+    date_plot_sort = date_plot * len(appear_loc)
+    date_plot_sort.sort()
+    template_df_plot = gl.SFrame({'location': appear_loc * len(date_plot),
+                                  'date_num': date_plot_sort})
+
+    heatmap_df_join = template_df_plot.join(
+        daily_record.select_columns(['location', 'date_count', 'date_num']),
+        on=['date_num', 'location'],
+        how='left'
+    )
+    heatmap_df_join = heatmap_df_join.fillna('date_count', 0)
+    heatmap_pivot = heatmap_df_join.to_dataframe().pivot("location", "date_num", "date_count")
+    if locations is not None:
+        heatmap_pivot.index = [locations.value(location) for location in heatmap_pivot.index]
+
+    height = len(appear_loc)
+    fig_width = 28. / 365 * duration
+    fig, ax = plt.subplots(dpi=300, figsize=(fig_width, height))
+    plt.subplots_adjust(left=0.05, bottom=0.2, right=0.97, top=0.95)
+    cmap = sns.cubehelix_palette(dark=0, light=1, as_cmap=True)
+    sns.heatmap(heatmap_pivot, cmap=cmap, cbar=False, linewidths=1)
+
+    for xline in np.arange(duration):
+        plt.axvline(xline, color='lightgray', alpha=0.5)
+    for yline in range(len(appear_loc) + 1):
+        plt.axhline(yline, color='lightgray', alpha=0.5)
+
+    location_appear_df = gl.SFrame({'location': appear_loc})
+    location_appear_df = location_appear_df.sort('location')
+    location_appear_df['y_order'] = range(len(appear_loc))
+    location_y_order_loc_appear = (location_appear_df
+                                   .select_columns(['location', 'y_order'])
+                                   .to_dataframe()
+                                   .set_index('location')
+                                   .to_dict(orient='dict')['y_order'])
+
+    ori_xaxis_idx = date_num_long.filter_by(month_all_axis_trans, 'date')['date_num']
+    ori_xaxis_idx.sort()
+    xaxis_idx = np.array(ori_xaxis_idx) + 0.5 - start_day
+    month_all_axis = [d[:4] + '-' + d[4:6] + '-' + d[6:8] for d in month_all_axis]
+    plt.xticks(xaxis_idx, month_all_axis, fontsize=22, rotation=30)
+    plt.yticks(fontsize=25, rotation='horizontal')
+    plt.tick_params(axis='both', which='both', bottom='on', top='off',
+                    labelbottom='on', right='off', left='off',
+                    labelleft='on')
+    plt.ylabel('Location', fontsize=22)
+    plt.xlabel('Date', fontsize=22)
+    return fig, ax, location_y_order_loc_appear, appear_loc
+
+
+def add_segment_patch(ax, plot_segment, location_y_order_loc_appear, start_day):
+    """
+    Highlight the segments of the plotted locations with red rectangles.
+
+    Attributes
+    ----------
+    ax : matplotlib.axes.Axes
+        Axes returned by plot_traj_common
+    plot_segment : dict
+        Segments to highlight: {location: [[start, end], ...]}
+    location_y_order_loc_appear : dict
+        y position of each location in the figure
+    start_day : int
+        index of start day
+    """
+    for location, value in plot_segment.items():
+        y_min = location_y_order_loc_appear[location]
+        for segment in value:
+            seg_start = segment[0]
+            seg_end = segment[1]
+            ax.add_patch(
+                patches.Rectangle((seg_start - start_day, y_min),
+                                  seg_end - seg_start + 1, 1,
+                                  linewidth=4,
+                                  edgecolor='red',
+                                  facecolor='none')
+            )
@@ -0,0 +1,37 @@
+import graphlab as gl
+
+SIZE_UNIT = {'': 1, 'B': 1, 'K': 2 ** 10, 'KB': 2 ** 10, 'M': 2 ** 20, 'MB': 2 ** 20,
+             'G': 2 ** 30, 'GB': 2 ** 30, 'T': 2 ** 40, 'TB': 2 ** 40}
+
+
+def parse_size(size):
+    """
+    Convert a memory size such as 512MB, 4G or 1073741824 to the number of bytes.
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    size = str(size).strip().upper()
+    number = size.rstrip('KMGTB')
+    unit = size[len(number):]
+    assert number and unit in SIZE_UNIT, "memory size must be like 512MB, 4GB or 1073741824, not " + size
+    return int(float(number) * SIZE_UNIT[unit])
+
+
+def set_runtime(workers=None, memory_limit=None):
+    """
+    Configure the parallelism and memory budget of the computing engine.
+
+    Attributes
+    ----------
+    workers : int
+        Number of worker processes that run the per-user functions in parallel
+    memory_limit : int or str
+        Memory for the engine to cache data before spilling to disk, e.g. '4GB'
+    """
+    if workers is not None:
+        assert workers > 0, "workers must be a positive number"
+        gl.set_runtime_config('GRAPHLAB_DEFAULT_NUM_PYLAMBDA_WORKERS', workers)
+    if memory_limit is not None:
+        memory_limit = parse_size(memory_limit)
+        gl.set_runtime_config('GRAPHLAB_FILEIO_MAXIMUM_CACHE_CAPACITY', memory_limit)
+        gl.set_runtime_config('GRAPHLAB_FILEIO_MAXIMUM_CACHE_CAPACITY_PER_FILE', memory_limit)
@@ -0,0 +1,182 @@
+"""
+Skew-aware parallel computation of the segments (steps 1-5 of find_migrants).
+
+The cost of a user grows with the number of records and superlinearly with the
+number of locations (every segment is compared with the segments of the other
+locations over the days they cover). Users are bin-packed into tasks of similar
+cost; users costing more than an average task get a task of their own, and the
+tasks are run from the most expensive one in a process pool.
+"""
+from __future__ import division, print_function
+import collections
+import heapq
+import time
+import numpy as np
+import graphlab as gl
+from multiprocessing import Pool, cpu_count
+from .traj_utils import flatten_records, num_locations
+
+# Only the heaviest users are packed one by one (longest processing time first)
+LPT_USERS_PER_TASK = 64
+TASKS_PER_PROCESS = 4
+# Tasks submitted ahead of the results, so only their records are held in memory
+PENDING_TASKS_PER_PROCESS = 2
+# segments sent back by the workers as flat lists of ints (see traj_utils.SEGMENT_DTYPE)
+SEGMENT_COLUMNS = ['segment_dict', 'segment_over_prop', 'medium_segment', 'long_seg']
+
+
+def user_cost(num_record, num_location, span):
+    """
+    Estimated cost of the segment steps of users (SArray or numpy arrays).
+    """
+    return num_record + num_location * num_location * span
+
+
+def record_cost(all_record):
+    """
+    user_cost of one user from 'all_record'.
+    """
+    days = [day for dates in all_record.values() for day in dates]
+    if len(days) == 0:
+        return 0
+    return user_cost(len(days), len(all_record), max(days) - min(days) + 1)
+
+
+def plan_tasks(cost, num_tasks):
+    """
+    Assign users to tasks of balanced total cost.
+
+    Users costing more than the average task are outliers with a task of
+    their own. The heaviest other users are assigned one by one to the
+    least loaded task (LPT); the rest, each lighter than all of those, fill
+    the tasks up to the average in a vectorized pass.
+
+    Return the task of each user (numpy array).
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    task = np.zeros(len(cost), dtype=np.int64)
+    if len(cost) == 0:
+        return task
+    order = np.argsort(-cost, kind='mergesort')
+    target = cost.sum() / num_tasks
+    num_outlier = int((cost[order] > target).sum())
+    task[order[:num_outlier]] = np.arange(num_outlier)
+
+    regular = order[num_outlier:]
+    num_lpt = min(len(regular), num_tasks * LPT_USERS_PER_TASK)
+    load = np.zeros(num_tasks)
+    heap = [(0.0, i) for i in range(num_tasks)]
+    for user in regular[:num_lpt]:
+        task_load, i = heapq.heappop(heap)
+        task[user] = num_outlier + i
+        load[i] = task_load + cost[user]
+        heapq.heappush(heap, (load[i], i))
+
+    rest = regular[num_lpt:]
+    if len(rest) > 0:
+        fill_target = (load.sum() + cost[rest].sum()) / num_tasks
+        capacity = np.maximum(fill_target - load, 0)
+        boundary = np.cumsum(capacity)
+        # the middle of each user's cost decides which capacity it falls in
+        position = np.cumsum(cost[rest]) - cost[rest] / 2
+        i = np.minimum(np.searchsorted(boundary, position), num_tasks - 1)
+        task[rest] = num_outlier + i
+    return task
+
+
+def run_segment_task(args):
+    """
+    Compute the segments of the users of one task (in a worker process).
+    """
+    from .core import compute_segments
+    task, keys, all_records, segment_params = args
+    start = time.time()
+    segments = []
+    for all_record in all_records:
+        x = compute_segments(all_record, **segment_params)
+        for column in SEGMENT_COLUMNS:
+            x[column] = flatten_records(x[column])
+        segments.append(x)
+    return task, keys, segments, time.time() - start
+
+
+def segment_frame(user_columns, keys, segments):
+    """
+    SFrame of the segments of a task returned by run_segment_task.
+    """
+    columns = dict((column, [key[j] for key in keys])
+                   for j, column in enumerate(user_columns))
+    columns['filled_record'] = gl.SArray([x['filled_record'] for x in segments], dtype=dict)
+    for column in SEGMENT_COLUMNS:
+        columns[column] = gl.SArray([x[column] for x in segments], dtype=list)
+    return gl.SFrame(columns)
+
+
+def compute_segments_parallel(user_traj, user_columns, segment_params,
+                              processes=None, num_tasks=None):
+    """
+    Steps 1-5 of find_migrants with balanced tasks in a process pool.
+    The records of a task are read from user_traj when it is submitted, with at
+    most PENDING_TASKS_PER_PROCESS tasks per process waiting for their result.
+    Return user_traj with the segment columns, and print the time of each task.
+    """
+    processes = processes or cpu_count()
+    num_tasks = num_tasks or processes * TASKS_PER_PROCESS
+    if 'cost' not in user_traj.column_names():
+        user_traj['cost'] = user_traj['all_record'].apply(record_cost, dtype=int)
+    user_traj = user_traj.select_columns(user_columns + ['all_record', 'cost'])
+    if len(user_traj) == 0:
+        user_traj['filled_record'] = gl.SArray([], dtype=dict)
+        for column in SEGMENT_COLUMNS:
+            user_traj[column] = gl.SArray([], dtype=list)
+        for column in ['long_seg_num', 'medium_segment_num', 'segment_over_prop_num']:
+            user_traj[column] = gl.SArray([], dtype=int)
+        return user_traj
+    cost = np.array(user_traj['cost'], dtype=np.float64)
+    user_task = plan_tasks(cost, num_tasks)
+
+    # the users of each task are contiguous rows once sorted by task
+    rows = user_traj.select_columns(user_columns + ['all_record'])
+    rows['task'] = gl.SArray(user_task.tolist(), dtype=int)
+    rows = rows.sort('task')
+    task_size = np.bincount(user_task)
+    task_start = np.cumsum(task_size) - task_size
+    task_cost = np.bincount(user_task, weights=cost)
+    task_order = sorted(np.unique(user_task), key=lambda t: -task_cost[t])
+    print('Start: %d users in %d tasks (%d outliers) on %d processes' % (
+        len(cost), len(task_order), int((cost > cost.sum() / num_tasks).sum()), processes))
+
+    def submit(t):
+        task_rows = rows[int(task_start[t]):int(task_start[t] + task_size[t])]
+        keys = [[row[column] for column in user_columns] for row in task_rows]
+        return pool.apply_async(run_segment_task,
+                                [(t, keys, list(task_rows['all_record']), segment_params)])
+
+    def collect(result):
+        task, keys, segments, elapsed = result.get()
+        print('Task %d: %d users, cost %.3g, %.1f s' % (
+            task, len(keys), task_cost[task], elapsed))
+        return segment_frame(user_columns, keys, segments)
+
+    segment_sf = None
+    pending = collections.deque()
+    pool = Pool(processes)
+    try:
+        for t in task_order:
+            if len(pending) >= PENDING_TASKS_PER_PROCESS * processes:
+                # the oldest task is the largest of the pending ones
+                task_sf = collect(pending.popleft())
+                segment_sf = task_sf if segment_sf is None else segment_sf.append(task_sf)
+            pending.append(submit(t))
+        while pending:
+            task_sf = collect(pending.popleft())
+            segment_sf = task_sf if segment_sf is None else segment_sf.append(task_sf)
+    finally:
+        pool.close()
+        pool.join()
+
+    user_traj = user_traj.join(segment_sf, on=user_columns)
+    user_traj['long_seg_num'] = user_traj['long_seg'].apply(num_locations)
+    user_traj['medium_segment_num'] = user_traj['medium_segment'].apply(num_locations)
+    user_traj['segment_over_prop_num'] = user_traj['segment_over_prop'].apply(num_locations)
+    return user_traj
@@ -0,0 +1,220 @@
+"""
+Local HTTP service that answers queries about the users of a TrajRecord saved
+with TrajRecord.save, without reading and detecting again.
+
+The trajectories and the result are loaded once and indexed in memory by user
+and by (home, destination, month); each request is answered from the indexes
+in its own thread.
+
+    GET  /users/<user_id>                    status, events and segments
+    GET  /users/<user_id>/status|events|segments
+    GET  /flows?home=..&destination=..&month=YYYYMM[&level=..]
+    GET  /batch?users=<user_id>,<user_id>,...
+    POST /batch  {"users": [...], "fields": ["status", "events", "segments"]}
+"""
+from __future__ import print_function
+import json
+import BaseHTTPServer
+import SocketServer
+import urlparse
+from .core import TrajRecord
+from .traj_utils import to_segments
+
+EVENT_COLUMNS = ['home', 'destination', 'migration_date', 'uncertainty', 'num_error_day',
+                 'home_start_date', 'home_end_date',
+                 'destination_start_date', 'destination_end_date']
+FIELDS = ['status', 'events', 'segments']
+
+
+class MigrationIndex():
+    """
+    In-memory indexes of the users, segments and migration events of a TrajRecord.
+    Users, homes and destinations are looked up by their string values.
+    """
+    def __init__(self, traj, result=None):
+        """
+        Attributes
+        ----------
+        traj : TrajRecord
+            Trajectories after find_migrants (with 'long_seg' in user_traj)
+        result : gl.SFrame
+            Result of find_migrants
+        user_events : dict
+            {user_id: [event, ...]}
+        user_segments : dict
+            {user_id: [segment, ...]} of the long segments (step 5)
+        flow_events : dict
+            {(home, destination, month): [event with user_id, ...]}
+        """
+        self.user_events = {}
+        self.user_segments = {}
+        self.flow_events = {}
+        if traj.user_ids is not None:
+            self.users = set(str(value) for value in traj.user_ids.table['value'])
+        else:
+            self.users = set(str(value) for value in traj.user_traj['user_id'].unique())
+        if traj.locations is not None:
+            location_values = list(traj.locations.table.sort('code')['value'])
+        else:
+            location_values = None
+        levels = 'level' in traj.user_traj.column_names()
+
+        if 'long_seg' in traj.user_traj.column_names():
+            user_seg = traj.decode(traj.user_traj.select_columns(
+                traj.user_columns() + ['long_seg']).dropna('long_seg'))
+            for row in user_seg:
+                segments = self.user_segments.setdefault(str(row['user_id']), [])
+                for location, start, end in to_segments(row['long_seg']).tolist():
+                    if location_values is not None:
+                        location = location_values[location]
+                    segment = {'location': location,
+                               'start_date': traj.index2date[start],
+                               'end_date': traj.index2date[end]}
+                    if levels:
+                        segment['level'] = row['level']
+                    segments.append(segment)
+            for segments in self.user_segments.values():
+                segments.sort(key=lambda x: (x.get('level'), x['start_date']))
+
+        if result is not None and len(result) > 0:
+            columns = traj.user_columns() + EVENT_COLUMNS
+            for row in traj.decode(result).select_columns(columns):
+                user_id = str(row['user_id'])
+                event = dict((column, row[column]) for column in columns if column != 'user_id')
+                self.user_events.setdefault(user_id, []).append(event)
+                flow_event = dict(event, user_id=user_id)
+                key = (str(row['home']), str(row['destination']), row['migration_date'] // 100)
+                self.flow_events.setdefault(key, []).append(flow_event)
+            for events in self.user_events.values():
+                events.sort(key=lambda x: (x.get('level'), x['migration_date']))
+            for events in self.flow_events.values():
+                events.sort(key=lambda x: (x['migration_date'], x['user_id']))
+
+    def status(self, user_id):
+        """
+        'migrant', 'non_migrant', or 'unknown' if the user is not in the data.
+        """
+        if user_id in self.user_events:
+            return 'migrant'
+        if user_id in self.users:
+            return 'non_migrant'
+        return 'unknown'
+
+    def events(self, user_id):
+        return self.user_events.get(user_id, [])
+
+    def segments(self, user_id):
+        return self.user_segments.get(user_id, [])
+
+    def user(self, user_id, fields=FIELDS):
+        """
+        Answer of the fields of one user.
+        """
+        answer = {'user_id': user_id}
+        for field in fields:
+            answer[field] = getattr(self, field)(user_id)
+        return answer
+
+    def batch(self, user_ids, fields=FIELDS):
+        """
+        Answers of several users, in the order of user_ids.
+        """
+        assert all(field in FIELDS for field in fields), "fields must be in " + str(FIELDS)
+        return [self.user(str(user_id), fields) for user_id in user_ids]
+
+    def flow(self, home, destination, month, level=None):
+        """
+        Migration events from home to destination in month (YYYYMM).
+        """
+        events = self.flow_events.get((str(home), str(destination), int(month)), [])
+        if level is not None:
+            events = [event for event in events if str(event.get('level')) == str(level)]
+        return events
+
+
+class QueryHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    JSON answers of the routes in the module docstring; the index is self.server.index.
+    """
+    def send_json(self, code, content):
+        body = json.dumps(content)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        query = dict((key, values[-1]) for key, values in urlparse.parse_qs(url.query).items())
+        parts = [part for part in url.path.split('/') if part]
+        index = self.server.index
+        try:
+            if parts == ['health']:
+                self.send_json(200, {'users': len(index.users), 'migrants': len(index.user_events)})
+            elif len(parts) in (2, 3) and parts[0] == 'users':
+                user_id = urlparse.unquote(parts[1])
+                if index.status(user_id) == 'unknown':
+                    self.send_json(404, {'user_id': user_id, 'status': 'unknown'})
+                elif len(parts) == 2:
+                    self.send_json(200, index.user(user_id))
+                elif parts[2] in FIELDS:
+                    self.send_json(200, index.user(user_id, [parts[2]]))
+                else:
+                    self.send_json(404, {'error': 'unknown field ' + parts[2]})
+            elif parts == ['flows']:
+                events = index.flow(query['home'], query['destination'], query['month'],
+                                    query.get('level'))
+                self.send_json(200, {'count': len(events), 'events': events})
+            elif parts == ['batch']:
+                fields = query['fields'].split(',') if 'fields' in query else FIELDS
+                self.send_json(200, {'results': index.batch(query['users'].split(','), fields)})
+            else:
+                self.send_json(404, {'error': 'unknown path ' + url.path})
+        except (KeyError, ValueError, AssertionError) as e:
+            self.send_json(400, {'error': 'bad query: ' + str(e)})
+
+    def do_POST(self):
+        if urlparse.urlparse(self.path).path.strip('/') != 'batch':
+            self.send_json(404, {'error': 'unknown path ' + self.path})
+            return
+        try:
+            content = json.loads(self.rfile.read(int(self.headers.getheader('Content-Length', 0))))
+            results = self.server.index.batch(content['users'], content.get('fields', FIELDS))
+            self.send_json(200, {'results': results})
+        except (KeyError, ValueError, AssertionError) as e:
+            self.send_json(400, {'error': 'bad query: ' + str(e)})
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class QueryServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    HTTP server answering each request in a thread from a shared MigrationIndex.
+    """
+    daemon_threads = True
+
+    def __init__(self, index, host='127.0.0.1', port=8000, quiet=False):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), QueryHandler)
+        self.index = index
+        self.quiet = quiet
+
+
+def serve(path, host='127.0.0.1', port=8000, quiet=False):
+    """
+    Load a TrajRecord saved with TrajRecord.save, index it and answer queries
+    on http://host:port until interrupted.
+    """
+    traj, result = TrajRecord.load(path)
+    index = MigrationIndex(traj, result)
+    server = QueryServer(index, host, port, quiet)
+    print('Serving %d users (%d migrants) on http://%s:%d' % (
+        len(index.users), len(index.user_events), host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,146 @@
+"""
+File-based detection on several machines without a cluster service.
+
+partition_csv splits the input by a hash of user_id into shard files, so all
+the records of a user are in one shard. Each shard is then detected
+independently (e.g. on another machine, with the day index pinned to the
+dates of the whole input, see read_csv start_date and end_date), and
+merge_results combines the results of the shards into the final files.
+"""
+from __future__ import print_function
+import json
+import os
+import numpy as np
+import graphlab as gl
+from .file_io import expand_paths, user_hash
+from .external_sort import PARSE_RECORD_BYTES
+from .runtime import parse_size
+
+PARTITION_FILE = 'partition.json'
+SHARD_FILE = 'shard_%05d.csv'
+COLUMNS = ['user_id', 'date', 'location']
+
+
+def partition_csv(file_path, output_dir, num_shards, memory_limit='1GB'):
+    """
+    Split the records of file_path (a file, a directory, a glob pattern or a
+    list of them, see read_csv) into num_shards csv files by user_hash(user_id).
+
+    The files are read in chunks of about memory_limit. The shard files and
+    partition.json, with the first and last date of all the records, are
+    written to output_dir. Return the paths of the shard files.
+    """
+    import pandas as pd
+    assert num_shards > 0, "num_shards must be a positive number"
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    shard_paths = [os.path.join(output_dir, SHARD_FILE % i) for i in range(num_shards)]
+    shard_files = [open(shard_path, 'w') for shard_path in shard_paths]
+    first_date = None
+    last_date = None
+    num_records = np.zeros(num_shards, dtype=np.int64)
+    chunk_records = max(1, parse_size(memory_limit) // PARSE_RECORD_BYTES)
+    try:
+        for f in shard_files:
+            f.write(','.join(COLUMNS) + '\n')
+        file_paths = expand_paths(file_path)
+        for one_path in file_paths:
+            # the values are written back as they are read (e.g. not 5.0 for
+            # the locations of a chunk with a missing location)
+            for chunk in pd.read_csv(one_path, usecols=COLUMNS,
+                                     dtype=dict((column, str) for column in COLUMNS),
+                                     chunksize=chunk_records):
+                chunk = chunk[COLUMNS]
+                # hash each user of the chunk once; a missing user_id is hashed as 'nan'
+                user_codes, users = pd.factorize(chunk['user_id'].fillna('nan').values)
+                user_shards = np.array([user_hash(user_id) % num_shards for user_id in users],
+                                       dtype=np.int64)
+                shard = user_shards[user_codes]
+                for i in np.unique(shard):
+                    shard_chunk = chunk[shard == i]
+                    shard_chunk.to_csv(shard_files[i], header=False, index=False)
+                    num_records[i] += len(shard_chunk)
+                if len(chunk) > 0:
+                    date = chunk['date'].values.astype(np.int64)
+                    first_date = date.min() if first_date is None else min(first_date, date.min())
+                    last_date = date.max() if last_date is None else max(last_date, date.max())
+    finally:
+        for f in shard_files:
+            f.close()
+    assert first_date is not None, "no records in " + str(file_path)
+    with open(os.path.join(output_dir, PARTITION_FILE), 'w') as f:
+        json.dump({'num_shards': num_shards,
+                   'start_date': int(first_date),
+                   'end_date': int(last_date),
+                   'num_records': num_records.tolist(),
+                   'files': [os.path.abspath(path) for path in file_paths]},
+                  f, indent=2)
+    print('Split %d records into %d shards (%d to %d records)' % (
+        num_records.sum(), num_shards, num_records.min(), num_records.max()))
+    return shard_paths
+
+
+def read_partition_info(path):
+    """
+    Metadata of partition_csv, from its output directory or partition.json.
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, PARTITION_FILE)
+    with open(path) as f:
+        return json.load(f)
+
+
+def concat_csv(file_paths, save_file):
+    """
+    Concatenate csv files with the same header into save_file.
+    """
+    header = None
+    with open(save_file, 'w') as out:
+        for file_path in file_paths:
+            with open(file_path) as f:
+                file_header = f.readline()
+                if header is None:
+                    header = file_header
+                    out.write(header)
+                assert file_header == header, \
+                    "the columns of %s are not the same as the other files" % file_path
+                for line in f:
+                    out.write(line)
+
+
+def merge_flows(file_paths, save_file):
+    """
+    Sum the flows (see FlowMatrix.to_csv) of several shards into save_file.
+    """
+    flows = None
+    for file_path in file_paths:
+        sf = gl.SFrame.read_csv(file_path, verbose=False, column_type_hints={'weight': float})
+        flows = sf if flows is None else flows.append(sf)
+    keys = [column for column in flows.column_names() if column not in ['count', 'weight']]
+    flows = flows.groupby(keys, {'count': gl.aggregate.SUM('count'),
+                                 'weight': gl.aggregate.SUM('weight')})
+    flows.sort(keys).select_columns(keys + ['count', 'weight']).export_csv(save_file)
+
+
+def merge_results(result_dirs, result_path, file_names, flow_file=None):
+    """
+    Combine the files of the shard result directories into result_path.
+
+    file_names (e.g. the migration events and segments) are concatenated,
+    and flow_file is summed by (level,) period, home and destination.
+    Files missing from a shard, e.g. a shard without migrants, are skipped.
+    """
+    if not os.path.isdir(result_path):
+        os.makedirs(result_path)
+    for file_name in file_names + ([flow_file] if flow_file else []):
+        file_paths = [os.path.join(result_dir, file_name) for result_dir in result_dirs
+                      if os.path.isfile(os.path.join(result_dir, file_name))]
+        if not file_paths:
+            print('No shard has ' + file_name)
+            continue
+        save_file = os.path.join(result_path, file_name)
+        if file_name == flow_file:
+            merge_flows(file_paths, save_file)
+        else:
+            concat_csv(file_paths, save_file)
+        print('Merged %s of %d shards' % (file_name, len(file_paths)))
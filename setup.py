@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 setup(
   name = 'migration_detector',         # How you named your package folder (MyLib)
   packages = ['migration_detector'],   # Chose the same as "name"
@@ -17,6 +17,9 @@ setup(
           'matplotlib',
           'seaborn',
       ],
+  entry_points={
+    'console_scripts': ['migration-detector=migration_detector.cli:main'],
+  },
   classifiers=[
     'Development Status :: 3 - Alpha',      # Chose either "3 - Alpha", "4 - Beta" or "5 - Production/Stable" as the current state of your package
     'Intended Audience :: Developers',      # Define that your audience are developers
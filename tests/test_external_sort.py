@@ -0,0 +1,74 @@
+"""
+read_csv_external with a memory_limit small enough for several sorted runs,
+compared with read_csv on the same file.
+
+Run from the repository root: python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from migration_detector.date_utils import day_to_date
+from migration_detector.external_sort import PARSE_RECORD_BYTES, read_csv_external
+from migration_detector.file_io import read_csv
+from test_traj_utils import synthetic_records
+
+MEMORY_LIMIT = 200 * PARSE_RECORD_BYTES
+
+
+def write_records(file_path, users, first_day=17532):
+    """
+    csv file of the users (user ids 1000, 1001, ...) with the rows shuffled,
+    so every user has records in several runs.
+    """
+    rows = ['%d,%d,%d' % (user_id + 1000, day_to_date(first_day + day), location + 10)
+            for user_id, all_record in enumerate(users)
+            for location, days in all_record.items() for day in days]
+    np.random.RandomState(0).shuffle(rows)
+    with open(file_path, 'w') as f:
+        f.write('user_id,date,location\n')
+        f.write('\n'.join(rows) + '\n')
+    return len(rows)
+
+
+def decoded_records(traj):
+    """
+    {user id: {location: [date, ...]}} of a TrajRecord.
+    """
+    locations = dict((row['code'], row['value']) for row in traj.locations.table)
+    user_ids = dict((row['code'], row['value']) for row in traj.user_ids.table)
+    return dict((str(user_ids[row['user_id']]),
+                 dict((locations[location], sorted(traj.index2date[day] for day in days))
+                      for location, days in row['all_record'].items()))
+                for row in traj.user_traj)
+
+
+class TestExternalSort(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir, 'records.csv')
+        self.num_records = write_records(self.file_path, synthetic_records(2, num_users=30))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_same_as_read_csv(self):
+        # several runs, and several blocks per run in the merge
+        self.assertGreater(self.num_records, 10 * MEMORY_LIMIT // PARSE_RECORD_BYTES)
+        traj = read_csv_external(self.file_path, memory_limit=MEMORY_LIMIT)
+        expected = read_csv(self.file_path)
+        self.assertEqual(expected.index2date, traj.index2date)
+        self.assertEqual(len(expected.user_ids), len(traj.user_ids))
+        self.assertEqual(decoded_records(expected), decoded_records(traj))
+        self.assertEqual(len(expected.raw_traj), len(traj.raw_traj))
+
+    def test_user_codes_sorted(self):
+        traj = read_csv_external(self.file_path, memory_limit=MEMORY_LIMIT)
+        user_ids = traj.user_ids.table.sort('code')['value']
+        self.assertEqual(list(user_ids), sorted(user_ids))
+        self.assertEqual(sorted(traj.user_traj['user_id']), list(range(len(user_ids))))
+
+
+if __name__ == '__main__':
+    unittest.main()
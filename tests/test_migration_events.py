@@ -0,0 +1,111 @@
+"""
+Steps 7 and 8 of find_migrants (find_migration_events and expand_records),
+compared with the step functions of the segments stored as dicts
+(reference_traj_utils), as they were computed before on a table of migrations.
+
+Run from the repository root: python -m unittest discover tests
+"""
+import unittest
+import graphlab as gl
+from migration_detector.core import compute_segments, expand_records
+from migration_detector.traj_utils import (MIGRATION_EVENT_DTYPE, flatten_records,
+                                           find_migration_by_segment, find_migration_events,
+                                           segment_dict)
+from test_traj_utils import (EXAMPLE_FILES, read_example, reference_migrations, sframe_dict,
+                             synthetic_records)
+
+COLUMNS = ['user_id', 'home', 'destination', 'home_start', 'home_end',
+           'destination_start', 'destination_end', 'seg_diff', 'migration_day', 'num_error_day']
+# no limit on the segment lengths, short and long home or destination segments
+SEGMENT_LEN_FILTERS = [(0, float('inf'), 0, float('inf')),
+                       (0, 120, 0, float('inf')),
+                       (100, float('inf'), 50, 150)]
+
+
+def user_long_seg(users):
+    """
+    Users with their migrations of step 6, as find_migrants gives them to step 7.
+    """
+    rows = {'user_id': [], 'all_record': [], 'long_seg': [], 'migration_result': []}
+    for user_id, all_record in enumerate(users):
+        x = compute_segments(dict((location, list(days)) for location, days in all_record.items()))
+        migration_result = flatten_records(find_migration_by_segment(x['long_seg'], 0))
+        if migration_result:
+            rows['user_id'].append(user_id)
+            rows['all_record'].append(all_record)
+            rows['long_seg'].append(flatten_records(x['long_seg']))
+            rows['migration_result'].append(migration_result)
+    return gl.SFrame({'user_id': rows['user_id'],
+                      'all_record': gl.SArray(rows['all_record'], dtype=dict),
+                      'long_seg': gl.SArray(rows['long_seg'], dtype=list),
+                      'migration_result': gl.SArray(rows['migration_result'], dtype=list)})
+
+
+def former_steps(user_long_seg, max_gap_home_des, hmin, hmax, dmin, dmax):
+    """
+    Steps 6-8 of each user with the reference functions, from the segments of step 5.
+    """
+    return sorted((x['user_id'],) + migration
+                  for x in user_long_seg
+                  for migration in reference_migrations(
+                      x['all_record'], sframe_dict(segment_dict(x['long_seg'])), 0,
+                      max_gap_home_des, hmin, hmax, dmin, dmax))
+
+
+def events(user_long_seg, max_gap_home_des, hmin, hmax, dmin, dmax):
+    """
+    Steps 7 and 8 as in find_migrants.
+    """
+    user_long_seg = user_long_seg.copy()
+    user_long_seg['migration_event'] = user_long_seg.apply(
+        lambda x: flatten_records(find_migration_events(x, max_gap_home_des,
+                                                        hmin, hmax, dmin, dmax)),
+        dtype=list
+    )
+    seg_migr_filter = expand_records(user_long_seg, ['user_id'], 'migration_event',
+                                     MIGRATION_EVENT_DTYPE)
+    return sorted(tuple(row[column] for column in COLUMNS) for row in seg_migr_filter)
+
+
+class TestMigrationEvents(unittest.TestCase):
+    def setUp(self):
+        # the last user moves once, after a gap of 80 days without records
+        gap_user = {0: list(range(0, 120)), 1: list(range(200, 320))}
+        self.users = ([read_example(file_name) for file_name in EXAMPLE_FILES] +
+                      synthetic_records(1) + [gap_user])
+        self.gap_user_id = len(self.users) - 1
+        self.user_long_seg = user_long_seg(self.users)
+
+    def test_same_as_former_steps(self):
+        for max_gap_home_des in [30, 5]:
+            for hmin, hmax, dmin, dmax in SEGMENT_LEN_FILTERS:
+                expected = former_steps(self.user_long_seg, max_gap_home_des,
+                                        hmin, hmax, dmin, dmax)
+                self.assertEqual(expected, events(self.user_long_seg, max_gap_home_des,
+                                                  hmin, hmax, dmin, dmax))
+        self.assertGreater(len(events(self.user_long_seg, 30, *SEGMENT_LEN_FILTERS[0])), 0)
+
+    def test_segment_len_filters(self):
+        num_events = [len(events(self.user_long_seg, 30, hmin, hmax, dmin, dmax))
+                      for hmin, hmax, dmin, dmax in SEGMENT_LEN_FILTERS]
+        self.assertLess(num_events[1], num_events[0])
+        self.assertLess(num_events[2], num_events[0])
+
+    def test_all_migrations_filtered_by_gap(self):
+        self.assertIn(self.gap_user_id, self.user_long_seg['user_id'])
+        for max_gap_home_des in [30, 80]:
+            rows = events(self.user_long_seg, max_gap_home_des, *SEGMENT_LEN_FILTERS[0])
+            self.assertNotIn(self.gap_user_id, [row[0] for row in rows])
+            self.assertEqual(rows, former_steps(self.user_long_seg, max_gap_home_des,
+                                                *SEGMENT_LEN_FILTERS[0]))
+        rows = events(self.user_long_seg, 81, *SEGMENT_LEN_FILTERS[0])
+        self.assertIn(self.gap_user_id, [row[0] for row in rows])
+
+    def test_no_events(self):
+        gap_user = self.user_long_seg.filter_by([self.gap_user_id], 'user_id')
+        self.assertEqual(events(gap_user, 30, *SEGMENT_LEN_FILTERS[0]), [])
+        self.assertEqual(former_steps(gap_user, 30, *SEGMENT_LEN_FILTERS[0]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
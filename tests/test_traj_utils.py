@@ -0,0 +1,190 @@
+"""
+Steps 1-8 of find_migrants on fixed sample trajectories, compared with the
+step functions of the segments stored as dicts (reference_traj_utils).
+
+Run from the repository root: python -m unittest discover tests
+"""
+import csv
+import os
+import unittest
+from array import array
+import numpy as np
+from migration_detector.core import compute_segments
+from migration_detector.date_utils import date_to_day
+from migration_detector.traj_utils import (to_segments, flatten_records,
+                                           find_migration_by_segment, find_migration_events)
+import reference_traj_utils as reference
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'example')
+EXAMPLE_FILES = ['migrant_location_history_example1.csv',
+                 'migrant_location_history_example2.csv',
+                 'nonmigrant_location_history_example1.csv',
+                 'nonmigrant_location_history_example2.csv']
+PARAMS = [
+    {'num_stayed_days_migrant': 90, 'num_days_missing_gap': 7, 'small_seg_len': 30,
+     'seg_prop': 0.6, 'min_overlap_part_len': 0, 'max_gap_home_des': 30},
+    {'num_stayed_days_migrant': 20, 'num_days_missing_gap': 5, 'small_seg_len': 10,
+     'seg_prop': 0.5, 'min_overlap_part_len': 1, 'max_gap_home_des': 60},
+    {'num_stayed_days_migrant': 60, 'num_days_missing_gap': 10, 'small_seg_len': 20,
+     'seg_prop': 0.3, 'min_overlap_part_len': 0, 'max_gap_home_des': 5},
+]
+SEGMENT_PARAMS = ['num_stayed_days_migrant', 'num_days_missing_gap', 'small_seg_len',
+                  'seg_prop', 'min_overlap_part_len']
+
+
+def read_example(file_name):
+    """
+    all_record ({location: [day, ...]}) of an example file of one user.
+    """
+    with open(os.path.join(EXAMPLE_DIR, file_name)) as f:
+        rows = [(int(row['date']), int(row['location'])) for row in csv.DictReader(f)]
+    first_day = min(date_to_day(date) for date, _ in rows)
+    all_record = {}
+    for date, location in rows:
+        all_record.setdefault(location, []).append(date_to_day(date) - first_day)
+    return all_record
+
+
+def synthetic_records(seed, num_users=40):
+    """
+    all_record of users staying 40 to 250 days in a few locations, seen on a
+    fraction of the days, with short visits to the other locations.
+    The location codes are below 8, so the dict order of the reference
+    functions is the order of the locations (see test_segments).
+    """
+    rs = np.random.RandomState(seed)
+    users = []
+    for _ in range(num_users):
+        all_record = {}
+        day = 0
+        for _ in range(rs.randint(1, 5)):
+            location = rs.randint(0, 5)
+            stay = rs.randint(40, 250)
+            days = np.arange(day, day + stay)
+            days = days[rs.rand(stay) < rs.uniform(0.2, 0.95)]
+            all_record.setdefault(location, []).extend(days.tolist())
+            day += stay - rs.randint(0, 20)
+        for _ in range(rs.randint(0, 6)):
+            all_record.setdefault(rs.randint(0, 5), []).append(rs.randint(0, day))
+        users.append(dict((location, sorted(set(days))) for location, days in all_record.items()))
+    return users
+
+
+def sframe_dict(segments):
+    """
+    Segments of the reference functions as read back from a dict column of a SFrame.
+    """
+    return dict((location, [array('d', segment) for segment in location_segments])
+                for location, location_segments in segments.items())
+
+
+def reference_segments(segments):
+    return sorted((int(location), int(start), int(end))
+                  for location, location_segments in segments.items()
+                  for start, end in location_segments)
+
+
+def new_segments(segments):
+    return sorted(tuple(segment) for segment in to_segments(segments).tolist())
+
+
+def reference_steps(all_record, params, hmin=0, hmax=float('inf'), dmin=0, dmax=float('inf')):
+    """
+    Segments of steps 1-5 and migrations of steps 6-8 with the reference functions.
+    """
+    x = {'all_record': dict((location, list(days)) for location, days in all_record.items())}
+    x['filled_record'] = reference.fill_missing_day(
+        dict((location, list(days)) for location, days in all_record.items()),
+        params['num_days_missing_gap'])
+    x['segment_dict'] = sframe_dict(reference.find_segment(x['filled_record'],
+                                                           params['small_seg_len']))
+    x['segment_over_prop'] = sframe_dict(reference.filter_seg_appear_prop(
+        x, 'segment_dict', params['seg_prop']))
+    x['medium_segment'] = sframe_dict(reference.join_segment_if_no_gap(x['segment_over_prop']))
+    x['long_seg'] = sframe_dict(reference.change_overlap_segment(
+        x, 'medium_segment', params['min_overlap_part_len'], params['num_stayed_days_migrant']))
+    migrations = reference_migrations(x['all_record'], x['long_seg'],
+                                      params['min_overlap_part_len'],
+                                      params['max_gap_home_des'], hmin, hmax, dmin, dmax)
+    return x, migrations
+
+
+def reference_migrations(all_record, long_seg, min_overlap_part_len, max_gap_home_des,
+                         hmin=0, hmax=float('inf'), dmin=0, dmax=float('inf')):
+    """
+    Migrations of steps 6-8 with the reference functions, from the segments
+    of step 5 (as sframe_dict gives them).
+    """
+    migrations = []
+    if len(long_seg) > 1:
+        for migration in reference.find_migration_by_segment(long_seg, min_overlap_part_len):
+            home_segment, des_segment, home, des = migration
+            seg_diff = des_segment[0] - home_segment[1]
+            if (seg_diff > max_gap_home_des or
+                    not reference.filter_migration_segment_len(migration, hmin, hmax, dmin, dmax)):
+                continue
+            migration_day, num_error_day = reference.find_migration_day_segment(
+                {'home': home, 'destination': des, 'all_record': all_record,
+                 'migration_segment': reference.create_migration_dict(migration)})
+            migrations.append((int(home), int(des), int(home_segment[0]), int(home_segment[1]),
+                               int(des_segment[0]), int(des_segment[1]), int(seg_diff),
+                               migration_day, num_error_day))
+    return sorted(migrations)
+
+
+def new_steps(all_record, params, hmin=0, hmax=float('inf'), dmin=0, dmax=float('inf')):
+    """
+    Segments of steps 1-5 and migrations of steps 6-8 as in find_migrants.
+    """
+    x = compute_segments(dict((location, list(days)) for location, days in all_record.items()),
+                         **dict((name, params[name]) for name in SEGMENT_PARAMS))
+    migrations = []
+    if len(np.unique(x['long_seg']['location'])) > 1:
+        x['migration_result'] = flatten_records(
+            find_migration_by_segment(x['long_seg'], params['min_overlap_part_len']))
+        events = find_migration_events(x, params['max_gap_home_des'], hmin, hmax, dmin, dmax)
+        migrations = sorted(tuple(event) for event in events.tolist())
+    return x, migrations
+
+
+class TestSteps(unittest.TestCase):
+    def users(self):
+        return [read_example(file_name) for file_name in EXAMPLE_FILES] + synthetic_records(0)
+
+    def test_segments(self):
+        """
+        change_overlap_segment takes the other segments by location and start,
+        the reference in the dict order of the locations: they only differ
+        when overlaps are removed in chain, not with these users.
+        """
+        for params in PARAMS:
+            for all_record in self.users():
+                reference_x, _ = reference_steps(all_record, params)
+                x, _ = new_steps(all_record, params)
+                self.assertEqual(reference_x['filled_record'], x['filled_record'])
+                for column in ['segment_dict', 'segment_over_prop', 'medium_segment', 'long_seg']:
+                    self.assertEqual(reference_segments(reference_x[column]),
+                                     new_segments(x[column]), column)
+
+    def test_migrations(self):
+        num_migrations = 0
+        for params in PARAMS:
+            for all_record in self.users():
+                _, reference_migrations = reference_steps(all_record, params)
+                _, migrations = new_steps(all_record, params)
+                self.assertEqual(reference_migrations, migrations)
+                num_migrations += len(migrations)
+        self.assertGreater(num_migrations, 0)
+
+    def test_short_term_migrations(self):
+        for hmin, hmax, dmin, dmax in [(0, 120, 0, float('inf')), (100, float('inf'), 50, 150)]:
+            for all_record in self.users():
+                _, reference_migrations = reference_steps(all_record, PARAMS[1],
+                                                          hmin, hmax, dmin, dmax)
+                _, migrations = new_steps(all_record, PARAMS[1], hmin, hmax, dmin, dmax)
+                self.assertEqual(reference_migrations, migrations)
+
+
+if __name__ == '__main__':
+    unittest.main()